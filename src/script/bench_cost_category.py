@@ -0,0 +1,55 @@
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+from cost_category import monthly_cost_category
+
+# chintai_map 起動時の月額カテゴリ作成時間を比較する
+# 従来の行ごとの DataFrame.apply、配列演算での振り分け、結合ステージで保存済みの列の読み込み
+
+# 従来の振り分け（1行ずつ）
+def assign_color_category(row):
+    if pd.isna(row["月額"]):
+        return "不明"
+    elif row["月額"] <= 8:
+        return "8以下"
+    elif row["月額"] > 18:
+        return "18以上"
+    else:
+        return f"{int(row['月額'])}超～{int(row['月額']) + 1}以下"
+
+def elapsed_ms(fn):
+    start = time.perf_counter()
+    result = fn()
+    return (time.perf_counter() - start) * 1000, result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[100000, 500000])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for rows in args.rows:
+        # 実データに近い分布（一部欠損）の月額
+        monthly_cost = rng.lognormal(np.log(18), 0.35, rows).round(2)
+        monthly_cost[rng.random(rows) < 0.05] = np.nan
+        data = pd.DataFrame({"月額": monthly_cost})
+
+        apply_ms, expected = elapsed_ms(lambda: data.apply(assign_color_category, axis=1))
+        vectorized_ms, actual = elapsed_ms(lambda: monthly_cost_category(data["月額"]))
+        if not (actual.astype(str) == expected).all():
+            raise RuntimeError("Category mismatch")
+
+        # 結合ステージで保存した列を読むだけの場合
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "joined.parquet")
+            data.assign(月額カテゴリ=actual).to_parquet(path, index=False, compression="zstd")
+            read_ms, _ = elapsed_ms(lambda: pd.read_parquet(path, columns=["月額カテゴリ"]))
+
+        print(f"rows={rows}: apply {apply_ms:.0f}ms, vectorized {vectorized_ms:.1f}ms, "
+              f"precomputed read {read_ms:.1f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import time
+import argparse
+from crawl_scheduler import CrawlScheduler
+from fixture_server import start_fixture_server, render_listing_page
+from suumo_parser import parse_listing_html
+from rent_scraper import create_http_session, fetch_page_http, rate_limiter
+
+# ローカルのフィクスチャサーバーに対してワーカー数ごとの取得時間を計測する（HTTP+lxmlバックエンド）
+
+# 1ページあたりの解析時間（ミリ秒）
+def measure_parse(repeat=50):
+    page_html = render_listing_page("tokyo", 1, 1).encode("utf-8")
+    start = time.perf_counter()
+    for _ in range(repeat):
+        parse_listing_html(page_html)
+    return (time.perf_counter() - start) / repeat * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=20, help="1地域あたりのページ数")
+    parser.add_argument("--delay", type=float, default=0.2, help="1ページあたりの模擬読み込み時間（秒）")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    print(f"parse: {measure_parse():.2f} ms/page")
+
+    # フィクスチャサーバーには制限をかけない（スケジューラの並列度だけを測る）
+    rate_limiter.rate = rate_limiter.max_rate = 10000
+
+    regions = ["tokyo", "kanagawa", "chiba", "saitama"]
+    server, urls = start_fixture_server({region: args.pages for region in regions}, delay=args.delay)
+
+    baseline = None
+    expected = None
+    try:
+        for workers in args.workers:
+            result = {region: [] for region in urls}
+            scheduler = CrawlScheduler(urls, open_session=create_http_session, fetch_page=fetch_page_http,
+                                       close_session=lambda session: session.close(),
+                                       workers=workers, per_host_limit=workers,
+                                       on_page=lambda region, page, rows: result[region].extend(rows))
+            start = time.perf_counter()
+            scheduler.run()
+            elapsed = time.perf_counter() - start
+
+            # ワーカー数に関わらず同じ行が同じ順番で得られること
+            if expected is None:
+                expected = result
+            elif result != expected:
+                raise RuntimeError(f"Result mismatch with {workers} workers")
+
+            baseline = baseline or elapsed
+            rows = sum(len(r) for r in result.values())
+            print(f"workers={workers}: {elapsed:.2f}s, {rows} rows, speedup x{baseline / elapsed:.1f}")
+    finally:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.io as pio
+from data_store import read_dataset
+from map_figure import MapPoints, create_lean_map_figure, create_clustered_map_figure
+from map_clusters import ClusterGrid, initial_map_view
+
+# chintai_map の地図の図の作成時間とJSONサイズを比較する
+# plotly.express（従来）と、起動時に作った配列から go.Scattermapbox を直接作る方法、
+# さらに初期表示のズームレベル・表示範囲でクラスタにまとめる方法（件数が増えてもJSONサイズが増えない）
+time_range_color_map = {
+    "0-10分": "#d73027",
+    "11-20分": "#fc8d59",
+    "21-30分": "#fee08b",
+    "31-40分": "#d9ef8b",
+    "41-50分": "#91bfdb",
+    "51-60分": "#4575b4"
+}
+hover_columns = ["所要時間", "乗り換え回数", "路線名", "company", "月額", "月額_中央値", "月額_p10", "月額_p90", "件数"]
+initial_view = {"center": {"lat": 35.68, "lon": 139.76}, "zoom": 10}
+
+# 従来の図の作成
+def create_px_figure(filtered_data):
+    fig = px.scatter_mapbox(
+        filtered_data,
+        lat="lat",
+        lon="lon",
+        color="所要時間範囲",
+        color_discrete_map=time_range_color_map,
+        hover_name="駅名",
+        hover_data={column: True for column in hover_columns},
+        mapbox_style="carto-darkmatter"
+    )
+    fig.update_layout(
+        margin=dict(l=0, r=0, t=0, b=0),
+        paper_bgcolor="black",
+        mapbox=dict(center=initial_view["center"], zoom=initial_view["zoom"]),
+        showlegend=False,
+        uirevision="map-view"
+    )
+    fig.update_traces(marker=dict(size=12))
+    return fig
+
+# 1回あたりの作成時間（ミリ秒）とJSONのバイト数
+def measure(build, repeat):
+    build()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fig = build()
+    elapsed = (time.perf_counter() - start) / repeat * 1000
+    return elapsed, len(pio.to_json(fig, validate=False).encode("utf-8"))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    base = read_dataset("joined_data", columns=["駅名", "所要時間範囲", "lon", "lat"] + hover_columns)
+    for rows in args.rows:
+        data = pd.concat([base] * (rows // len(base) + 1), ignore_index=True).iloc[:rows]
+
+        start = time.perf_counter()
+        points = MapPoints(data, "駅名", hover_columns, {"所要時間範囲": ("所要時間範囲", time_range_color_map)})
+        startup_ms = (time.perf_counter() - start) * 1000
+        positions = np.arange(len(data))
+
+        # カテゴリごとの点の数と色が一致すること
+        # plotly.express はpandasの欠損（NA）をJSONにできないので件数を浮動小数にしておく
+        px_data = data.astype({"件数": "float64"})
+        px_fig = create_px_figure(px_data)
+        lean_fig = create_lean_map_figure(points, positions, "所要時間範囲", initial_view, "map-view")
+        expected = sorted((trace.name, trace.marker.color, len(trace.lat)) for trace in px_fig.data)
+        actual = sorted((trace["name"], trace["marker"]["color"], len(trace["lat"])) for trace in lean_fig["data"])
+        if expected != actual:
+            raise RuntimeError(f"Trace mismatch: {expected} != {actual}")
+
+        px_ms, px_bytes = measure(lambda: create_px_figure(px_data), args.repeat)
+        lean_ms, lean_bytes = measure(
+            lambda: create_lean_map_figure(points, positions, "所要時間範囲", initial_view, "map-view"), args.repeat
+        )
+        grid = ClusterGrid(data["lon"], data["lat"])
+        map_view = initial_map_view(initial_view)
+        clustered_ms, clustered_bytes = measure(
+            lambda: create_clustered_map_figure(points, grid, positions, "所要時間範囲", map_view, initial_view,
+                                                "map-view"),
+            args.repeat,
+        )
+        print(f"rows={rows}: px {px_ms:.1f}ms {px_bytes / 1024:.0f}KiB, "
+              f"lean {lean_ms:.1f}ms {lean_bytes / 1024:.0f}KiB (arrays built once in {startup_ms:.1f}ms), "
+              f"clustered {clustered_ms:.1f}ms {clustered_bytes / 1024:.0f}KiB")
+
+if __name__ == "__main__":
+    main()
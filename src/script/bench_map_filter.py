@@ -0,0 +1,142 @@
+import time
+import argparse
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from data_store import read_dataset
+from navitime_parser import commute_columns
+from filter_index import CommuteIndex
+
+# chintai_map のフィルタ処理をデータ件数ごとに計測する
+# 従来の文字列比較＋isin、インデックス（マスクのAND）、インデックス＋メモ化の3通りと、
+# 所要分・乗換回数の上限を並べ替え済み配列の二分探索で解決する CommuteIndex
+filter_columns = ["建物種別", "所要時間範囲", "乗り換え回数"]
+time_ranges = ["0-10分", "11-20分", "21-30分", "31-40分", "41-50分", "51-60分"]
+transfer_counts = ["乗換0回", "乗換1回", "乗換2回", "乗換3回"]
+
+# 列の値ごとに行のブールマスクを1度だけ作り、フィルタは値のOR・列のANDだけで解決するインデックス
+class FilterIndex:
+    def __init__(self, data, columns):
+        self.size = len(data)
+        self.values = {}  # 列 -> 欠損以外の値の一覧
+        self.masks = {}  # 列 -> {値: ブールマスク}
+        for column in columns:
+            categorical = pd.Categorical(data[column])
+            codes = categorical.codes
+            self.values[column] = list(categorical.categories)
+            self.masks[column] = {value: codes == code for code, value in enumerate(categorical.categories)}
+
+    # 列の値のいずれかに一致する行（values=Noneなら全行）
+    def column_mask(self, column, values):
+        mask = np.zeros(self.size, dtype=bool)
+        if values is None:
+            mask[:] = True
+            return mask
+        for value in values:
+            if value in self.masks[column]:
+                mask |= self.masks[column][value]
+        return mask
+
+    # 条件（列 -> 値のタプル or None）をすべて満たす行の位置
+    def select(self, conditions):
+        mask = np.ones(self.size, dtype=bool)
+        for column, values in conditions.items():
+            if values is not None:
+                mask &= self.column_mask(column, values)
+        return np.flatnonzero(mask)
+
+# アプリで選べるフィルタの組み合わせ
+def filter_combinations():
+    for building_type in ["", "賃貸アパート", "賃貸マンション"]:
+        for i in range(1, len(time_ranges) + 1):
+            for j in range(1, len(transfer_counts) + 1):
+                yield building_type, ",".join(time_ranges[:i]), ",".join(transfer_counts[:j])
+
+# 時間範囲・乗り換え回数の選択に相当する上限（「0-10分,11-20分」なら20分、「乗換0回,乗換1回」なら1回）
+def commute_limits(selected_time_ranges, selected_transfer_counts):
+    max_minutes = int(selected_time_ranges.split(",")[-1].split("-")[1].rstrip("分"))
+    max_transfers = int(selected_transfer_counts.split(",")[-1].strip("乗換回"))
+    return max_minutes, max_transfers
+
+# 建物種別は FilterIndex のマスク、所要分・乗換回数の上限は CommuteIndex で絞り込む
+def filter_with_commute_index(data, index, commute_index, selected_building_type, selected_time_ranges,
+                              selected_transfer_counts):
+    positions = commute_index.select(*commute_limits(selected_time_ranges, selected_transfer_counts))
+    if selected_building_type:
+        positions = positions[index.column_mask("建物種別", (selected_building_type,))[positions]]
+    return data.iloc[positions]
+
+# 従来のフィルタ処理
+def filter_with_isin(data, selected_building_type, selected_time_ranges, selected_transfer_counts):
+    filtered_data = data
+    if selected_building_type:
+        filtered_data = filtered_data[filtered_data["建物種別"] == selected_building_type]
+    filtered_data = filtered_data[
+        (filtered_data["所要時間範囲"].isin(selected_time_ranges.split(","))) &
+        (filtered_data["乗り換え回数"].isin(selected_transfer_counts.split(",")))
+    ]
+    return filtered_data
+
+def filter_with_index(data, index, selected_building_type, selected_time_ranges, selected_transfer_counts):
+    conditions = {
+        "建物種別": (selected_building_type,) if selected_building_type else None,
+        "所要時間範囲": tuple(selected_time_ranges.split(",")),
+        "乗り換え回数": tuple(selected_transfer_counts.split(",")),
+    }
+    return data.iloc[index.select(conditions)]
+
+# 全組み合わせを repeat 回ずつ実行したときの1回あたりの時間（ミリ秒）
+def measure(filter_fn, repeat):
+    combinations = list(filter_combinations())
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for combination in combinations:
+            filter_fn(*combination)
+    return (time.perf_counter() - start) / (repeat * len(combinations)) * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000, 500000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    base = read_dataset("joined_data")
+    # 所要分・乗換回数の列より前に作ったデータなら、ここで導出する
+    if "所要分" not in base.columns or "乗換回数" not in base.columns:
+        commute, _ = commute_columns(base)
+        base = base.assign(所要分=commute["所要分"], 乗換回数=commute["乗換回数"])
+    for rows in args.rows:
+        # 行を繰り返して件数を増やす（文字列列は従来どおりの文字列型）
+        data = pd.concat([base] * (rows // len(base) + 1), ignore_index=True).iloc[:rows]
+        string_data = data.astype({column: "string" for column in filter_columns})
+
+        start = time.perf_counter()
+        index = FilterIndex(data, filter_columns)
+        build_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        commute_index = CommuteIndex(data["所要分"], data["乗換回数"])
+        commute_build_ms = (time.perf_counter() - start) * 1000
+
+        # 結果が従来のフィルタと一致すること
+        for combination in filter_combinations():
+            expected = filter_with_isin(string_data, *combination).index
+            actual = filter_with_index(data, index, *combination).index
+            if not expected.equals(actual):
+                raise RuntimeError(f"Result mismatch for {combination}")
+            actual = filter_with_commute_index(data, index, commute_index, *combination).index
+            if not expected.equals(actual):
+                raise RuntimeError(f"Commute index mismatch for {combination}")
+
+        isin_ms = measure(lambda *c: filter_with_isin(string_data, *c), args.repeat)
+        index_ms = measure(lambda *c: filter_with_index(data, index, *c), args.repeat)
+        commute_ms = measure(lambda *c: filter_with_commute_index(data, index, commute_index, *c), args.repeat)
+        # メモ化は全組み合わせを1度実行してから計測する（2回目以降の呼び出し）
+        cached = lru_cache(maxsize=128)(lambda *c: filter_with_index(data, index, *c))
+        measure(cached, 1)
+        cached_ms = measure(cached, args.repeat)
+        print(f"rows={rows}: index build {build_ms:.1f}ms, isin {isin_ms:.2f}ms, "
+              f"index {index_ms:.2f}ms, memoized {cached_ms:.4f}ms per call, "
+              f"commute index build {commute_build_ms:.1f}ms, {commute_ms:.2f}ms per call")
+
+if __name__ == "__main__":
+    main()
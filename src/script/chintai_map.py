@@ -1,4 +1,3 @@
-import pandas as pd
 import dash
 from dash import dcc, html
 from dash.dependencies import Input, Output, State
@@ -6,6 +5,17 @@ import plotly.express as px
 import dash_bootstrap_components as dbc
 from dotenv import load_dotenv
 import os
+import sys
+import time
+import argparse
+import threading
+from functools import lru_cache
+from data_store import read_dataset, dataset_exists, dataset_version
+from filter_index import CommuteIndex, LatencyLog
+from response_cache import ResponseCache, with_viewport
+from map_figure import MapPoints, create_clustered_map_figure
+from map_clusters import ClusterGrid, initial_map_view, map_view_script
+from cost_category import monthly_cost_category
 
 # 環境変数からMapboxトークンを読み込み
 load_dotenv()
@@ -16,8 +26,35 @@ if not mapbox_token:
 px.set_mapbox_access_token(mapbox_token)
 
 # データの読み込み
-data = pd.read_csv("./output/joined_data.csv")
-data["company"] = data["company"].replace("不明", "その他")
+# 駅（1駅1行）と家賃の統計（駅×建物種別）を別々に読み、選択中の建物種別の分だけ結合する。
+# 月額の統計と色分け用の月額カテゴリは結合ステージで計算済みのものを使う（表示時には再計算しない）
+def load_data():
+    stations = read_dataset(
+        "station_dimension",
+        columns=["station_cd", "駅名", "所要時間範囲", "所要時間", "乗り換え回数", "所要分", "乗換回数", "路線名", "lon", "lat",
+                 "company"],
+    )
+    stations["company"] = stations["company"].astype("string").replace("不明", "その他").astype("category")
+    rent = read_dataset(
+        "rent_fact",
+        columns=["station_cd", "建物種別", "件数", "月額", "月額_中央値", "月額_p10", "月額_p90", "管理費率", "月額カテゴリ"],
+    )
+    return stations, rent
+
+# 入力データのバージョン（更新検知用）
+def current_data_version():
+    return (dataset_version("station_dimension"), dataset_version("rent_fact"))
+
+# 駅ディメンションと家賃ファクトは結合ステージの出力でリポジトリには含まれないので、なければ作り方を示して終了する
+missing_datasets = [name for name in ("station_dimension", "rent_fact") if not dataset_exists(name)]
+if missing_datasets:
+    sys.exit(
+        f"{', '.join(missing_datasets)} が見つかりません。リポジトリのルートで "
+        "python src/script/filter_station_data.py, dedup_listings.py, month_const.py, join_const.py "
+        "を順に実行してから起動してください（コミット済みのCSVから作れます）"
+    )
+stations, rent = load_data()
+data_version = current_data_version()
 
 # カラーマッピング（デフォルト）
 time_range_color_map = {
@@ -53,6 +90,8 @@ initial_view = {
     "center": {"lat": 35.68, "lon": 139.76},  # 東京駅付近
     "zoom": 10
 }
+# 図のuirevision（値が変わらない限りパン・ズームの状態が保たれる）
+map_uirevision = "map-view"
 
 # フィルタカードの作成
 def create_filter_card(title, children):
@@ -66,92 +105,119 @@ def create_filter_card(title, children):
         className="mb-4 bg-secondary shadow-sm"
     )
 
-# 所要時間範囲の選択肢生成
-def get_time_range_options():
-    return [
-        {"label": "10分まで", "value": "0-10分"},
-        {"label": "20分まで", "value": "0-10分,11-20分"},
-        {"label": "30分まで", "value": "0-10分,11-20分,21-30分"},
-        {"label": "40分まで", "value": "0-10分,11-20分,21-30分,31-40分"},
-        {"label": "50分まで", "value": "0-10分,11-20分,21-30分,31-40分,41-50分"},
-        {"label": "60分まで", "value": "0-10分,11-20分,21-30分,31-40分,41-50分,51-60分"}
-    ]
+# 所要時間の上限（分）のスライダーの目盛り
+def get_time_limit_marks():
+    return {minutes: f"{minutes}分" for minutes in range(10, 61, 10)}
 
-# 乗り換え回数の選択肢生成
-def get_transfer_options():
+# 建物種別の選択肢生成
+def get_building_type_options():
     return [
-        {"label": "乗り換え0回", "value": "乗換0回"},
-        {"label": "乗り換え1回まで", "value": "乗換0回,乗換1回"},
-        {"label": "乗り換え2回まで", "value": "乗換0回,乗換1回,乗換2回"},
-        {"label": "乗り換え3回まで", "value": "乗換0回,乗換1回,乗換2回,乗換3回"}
+        {"label": "無選択", "value": ""},
+        {"label": "賃貸アパート", "value": "賃貸アパート"},
+        {"label": "賃貸マンション", "value": "賃貸マンション"}
     ]
 
-def filter_data(selected_building_type, selected_time_ranges, selected_transfer_counts):
-    filtered_data = data
-
-    # 建物種別フィルタを適用
-    if selected_building_type and isinstance(selected_building_type, str):
-        filtered_data = filtered_data[filtered_data["建物種別"] == selected_building_type]
-    
-    # 所要時間範囲と乗り換え回数でフィルタリング
-    time_ranges = selected_time_ranges.split(",") if selected_time_ranges else data["所要時間範囲"].unique()
-    transfer_counts = selected_transfer_counts.split(",") if selected_transfer_counts else data["乗り換え回数"].unique()
-    filtered_data = filtered_data[
-        (filtered_data["所要時間範囲"].isin(time_ranges)) &
-        (filtered_data["乗り換え回数"].isin(transfer_counts))
-    ]
-    return filtered_data
+# 乗り換え回数の上限のスライダーの目盛り
+def get_transfer_limit_marks():
+    return {transfers: f"{transfers}回" for transfers in range(0, 4)}
 
+# 所要分・乗換回数の上限で絞り込むインデックス（駅ディメンションの行に対して）
+commute_index = CommuteIndex(stations["所要分"], stations["乗換回数"])
 
-# 色分け用のカラムを生成
-def assign_color_category(row):
-    if pd.isna(row["月額"]):
-        return "不明"
-    elif row["月額"] <= 8:
-        return "8以下"
-    elif row["月額"] > 18:
-        return "18以上"
-    else:
-        return f"{int(row['月額'])}超～{int(row['月額']) + 1}以下"
-
-data["月額カテゴリ"] = data.apply(assign_color_category, axis=1)
-
-# 地図の生成
-def create_map_figure(filtered_data, map_state, color_by):
-    if color_by == "所要時間範囲":
-        color_column = "所要時間範囲"
-        color_map = time_range_color_map
-    else:  # color_by == "月額"
-        color_column = "月額カテゴリ"
-        color_map = monthly_cost_color_map
-
-    fig = px.scatter_mapbox(
-        filtered_data,
-        lat="lat",
-        lon="lon",
-        color=color_column,
-        color_discrete_map=color_map,
+# ズームレベルごとのクラスタのセル（駅ディメンションの行に対して。建物種別ごとの駅一覧も同じ行の並び）
+cluster_grid = ClusterGrid(stations["lon"], stations["lat"])
+
+# 地図の座標・ホバー表示・色分けを配列にしておく
+def create_map_points(data):
+    return MapPoints(
+        data,
         hover_name="駅名",
-        hover_data={
-            "所要時間": True,
-            "乗り換え回数": True,
-            "路線名": True,
-            "company": True,
-            "月額": True
+        hover_columns=["所要時間", "乗り換え回数", "路線名", "company", "月額", "月額_中央値", "月額_p10", "月額_p90", "件数"],
+        color_columns={
+            "所要時間範囲": ("所要時間範囲", time_range_color_map),
+            "月額": ("月額カテゴリ", monthly_cost_color_map),
         },
-        mapbox_style="carto-darkmatter"
     )
-    fig.update_layout(
-        margin=dict(l=0, r=0, t=0, b=0),
-        paper_bgcolor="black",
-        mapbox=dict(
-            center=map_state["center"],
-            zoom=map_state["zoom"]
-        ),
-        showlegend=False  # 凡例を非表示
+
+callback_latency = LatencyLog("update_map")
+
+# 建物種別（無選択は空文字列）
+def normalize_building_type(selected_building_type):
+    return selected_building_type if selected_building_type and isinstance(selected_building_type, str) else ""
+
+# 建物種別ごとの駅一覧（駅ディメンションに家賃ファクトを左結合、行の並びは駅ディメンションと同じ）
+# 無選択のときは結合せず、家賃の列は欠損のまま
+@lru_cache(maxsize=8)
+def station_view(building_type):
+    facts = rent[rent["建物種別"] == building_type] if building_type else rent.iloc[0:0]
+    view = stations.merge(facts, on="station_cd", how="left", validate="one_to_one")
+    view["月額カテゴリ"] = view["月額カテゴリ"].fillna("不明")
+    return view
+
+# 建物種別ごとの地図の配列
+@lru_cache(maxsize=8)
+def view_points(building_type):
+    return create_map_points(station_view(building_type))
+
+# フィルタ結果はフィルタの組み合わせごとに使い回す（最近使った組み合わせを保持）
+@lru_cache(maxsize=128)
+def filter_data(selected_building_type, max_minutes, max_transfers):
+    building_type = normalize_building_type(selected_building_type)
+    # 所要時間と乗り換え回数の上限（Noneなら上限なし）
+    positions = commute_index.select(max_minutes, max_transfers)
+    view = station_view(building_type)
+    if building_type:
+        # 建物種別フィルタ（その建物種別の物件がある駅のみ）
+        positions = positions[view["建物種別"].notna().to_numpy()[positions]]
+    return view.iloc[positions]
+
+# 最安・最も高い駅の候補（建物種別が無選択なら表示中の駅の全建物種別の統計）
+def cost_candidates(filtered_data, building_type):
+    if building_type:
+        return filtered_data
+    return filtered_data[["station_cd", "駅名"]].merge(rent, on="station_cd")
+
+# 応答（図・路線表・駅カード）はフィルタの組み合わせとデータのバージョン（図はさらにズームレベル・表示範囲）ごとにキャッシュする
+response_cache = ResponseCache(max_entries=256)
+reload_lock = threading.Lock()
+
+# 駅ディメンション・家賃ファクトが更新されていたらデータ・インデックス・キャッシュを作り直す
+def reload_if_changed():
+    global stations, rent, commute_index, cluster_grid, data_version
+    version = current_data_version()
+    if version == data_version:
+        return
+    with reload_lock:
+        if version == data_version:
+            return
+        print("駅・家賃データが更新されたため再読み込みします")
+        new_stations, new_rent = load_data()
+        stations, rent, commute_index, cluster_grid, data_version = (
+            new_stations, new_rent, CommuteIndex(new_stations["所要分"], new_stations["乗換回数"]),
+            ClusterGrid(new_stations["lon"], new_stations["lat"]), version
+        )
+        station_view.cache_clear()
+        view_points.cache_clear()
+        filter_data.cache_clear()
+        response_cache.clear()
+
+# 駅カードの表示文字列（中央値・平均・件数）
+def format_station_cost(row):
+    return f"{row['駅名']}（月額中央値: {row['月額_中央値']}万円、平均: {row['月額']}万円、{row['件数']}件）"
+
+# クラスタの色分け用の月額カテゴリ（クラスタ内の月額の中央値で振り分ける）
+def label_clusters_by_cost(clusters):
+    return monthly_cost_category(clusters["median"]).astype(str).to_numpy(dtype=object)
+
+# 地図の生成（建物種別ごとに作った配列から、表示範囲内の点をズームレベルのセルごとにまとめて作る）
+def create_map_figure(filtered_data, map_state, map_view, color_by, building_type):
+    view = station_view(building_type)
+    return create_clustered_map_figure(
+        view_points(building_type), cluster_grid, filtered_data.index.to_numpy(), color_by, map_view, map_state,
+        map_uirevision, mapbox_token,
+        values=view["月額"].to_numpy(dtype=float, na_value=float("nan")) if building_type else None,
+        label_clusters=label_clusters_by_cost if color_by == "月額" else None,
     )
-    fig.update_traces(marker=dict(size=12))
-    return fig
 
 # アプリのレイアウト
 # アプリのレイアウト
@@ -165,32 +231,33 @@ app.layout = dbc.Container(
                             "建物種別",
                             dcc.RadioItems(
                                 id="building-type-filter",
-                                options=[
-                                    {"label": "無選択", "value": ""},
-                                    {"label": "賃貸アパート", "value": "賃貸アパート"},
-                                    {"label": "賃貸マンション", "value": "賃貸マンション"}
-                                ],
+                                options=get_building_type_options(),
                                 value="",  # デフォルトは無選択（空文字列）
                                 inline=True,
                                 className="text-light"
                             )
                         ),
                         create_filter_card(
-                            "所要時間範囲",
-                            dcc.Dropdown(
-                                id="time-range-filter",
-                                options=get_time_range_options(),
-                                value="0-10分",  # 初期値を設定
-                                className="text-dark"
+                            "所要時間（上限）",
+                            dcc.Slider(
+                                id="max-minutes-filter",
+                                min=5,
+                                max=60,
+                                step=1,
+                                marks=get_time_limit_marks(),
+                                value=10,  # 初期値を設定
+                                tooltip={"placement": "bottom"}
                             )
                         ),
                         create_filter_card(
-                            "乗り換え回数",
-                            dcc.Dropdown(
-                                id="transfer-count-filter",
-                                options=get_transfer_options(),
-                                value="乗換0回",
-                                className="text-dark"
+                            "乗り換え回数（上限）",
+                            dcc.Slider(
+                                id="max-transfers-filter",
+                                min=0,
+                                max=3,
+                                step=1,
+                                marks=get_transfer_limit_marks(),
+                                value=0
                             )
                         ),
                         # 最安の駅カード
@@ -231,40 +298,81 @@ app.layout = dbc.Container(
             ],
             className="g-0 bg-black"
         ),
-        dcc.Store(id="map-state", data=initial_view)  # 地図状態を保持するためのストレージ
+        dcc.Store(id="map-state", data=initial_view),  # 地図状態を保持するためのストレージ
+        dcc.Store(id="map-view", data=initial_map_view(initial_view)),  # クラスタのズームレベルと表示範囲
     ],
     fluid=True
 )
 
-@app.callback(
+# 地図の表示範囲の保存（ブラウザ側で処理し、ズームレベルが変わるか表示範囲が前回の範囲を出たときだけ map-view を更新する）
+app.clientside_callback(
+    map_view_script,
     [
-        Output("map-graph", "figure"),
         Output("map-state", "data"),
+        Output("map-view", "data")
+    ],
+    Input("map-graph", "relayoutData"),
+    [
+        State("map-state", "data"),
+        State("map-view", "data")
+    ]
+)
+
+# フィルタかクラスタのズームレベル・表示範囲が変わったときに地図を作り直す（中心・ズームはStateとして読むだけ）
+@app.callback(
+    Output("map-graph", "figure"),
+    [
+        Input("building-type-filter", "value"),
+        Input("max-minutes-filter", "value"),
+        Input("max-transfers-filter", "value"),
+        Input("map-view", "data")
+    ],
+    State("map-state", "data")
+)
+def update_map(selected_building_type, max_minutes, max_transfers, map_view, map_state):
+    with callback_latency.measure():
+        reload_if_changed()
+        view_key = (map_view["level"], tuple(round(value, 4) for value in map_view["bbox"]))
+        figure = response_cache.get_or_build(
+            ("figure", data_version, selected_building_type, max_minutes, max_transfers, view_key),
+            lambda: build_map_figure(selected_building_type, max_minutes, max_transfers, map_view),
+        )
+        return with_viewport(figure, map_state)
+
+# フィルタが変わったときだけ路線表と駅カードを作り直す
+@app.callback(
+    [
         Output("route-table", "children"),
         Output("cheapest-station", "children"),
         Output("most-expensive-station", "children")
     ],
     [
         Input("building-type-filter", "value"),
-        Input("time-range-filter", "value"),
-        Input("transfer-count-filter", "value"),
-        Input("map-graph", "relayoutData")
-    ],
-    State("map-state", "data")
+        Input("max-minutes-filter", "value"),
+        Input("max-transfers-filter", "value")
+    ]
 )
-def update_map(selected_building_type, selected_time_ranges, selected_transfer_counts, relayout_data, map_state):
-    # 地図状態を更新
-    if relayout_data:
-        if "mapbox.center" in relayout_data:
-            map_state["center"] = relayout_data["mapbox.center"]
-        if "mapbox.zoom" in relayout_data:
-            map_state["zoom"] = relayout_data["mapbox.zoom"]
+def update_summary(selected_building_type, max_minutes, max_transfers):
+    reload_if_changed()
+    return response_cache.get_or_build(
+        ("summary", data_version, selected_building_type, max_minutes, max_transfers),
+        lambda: build_summary(selected_building_type, max_minutes, max_transfers),
+    )
 
-    # データをフィルタリング
-    filtered_data = filter_data(selected_building_type, selected_time_ranges, selected_transfer_counts)
+# 地図の生成（図は初期表示範囲で作ってdictにしておく）
+def build_map_figure(selected_building_type, max_minutes, max_transfers, map_view):
+    building_type = normalize_building_type(selected_building_type)
+    filtered_data = filter_data(building_type, max_minutes, max_transfers)
 
     # 色分けを決定
     color_by = "所要時間範囲" if not selected_building_type else "月額"
+    return create_map_figure(filtered_data, initial_view, map_view, color_by, building_type)
+
+# 路線表・最安/最も高い駅の生成
+def build_summary(selected_building_type, max_minutes, max_transfers):
+    # データをフィルタリング
+    building_type = normalize_building_type(selected_building_type)
+    filtered_data = filter_data(building_type, max_minutes, max_transfers)
 
     # ユニークな路線名を取得して表形式で表示
     unique_routes = filtered_data["路線名"].unique()
@@ -281,34 +389,38 @@ def update_map(selected_building_type, selected_time_ranges, selected_transfer_c
         style={"maxHeight": "300px", "overflowY": "scroll", "border": "1px solid #ccc"}
     )
 
-    # 最安・最も高い駅の計算
-    if not filtered_data.empty:
+    # 最安・最も高い駅の計算（一部の高額物件に引っ張られないよう月額の中央値で比較）
+    candidates = cost_candidates(filtered_data, building_type)
+    if candidates["月額_中央値"].notna().any():
         # 最安の駅
-        cheapest = filtered_data.loc[filtered_data["月額"].idxmin()]
-        cheapest_station = f"{cheapest['駅名']}（月額: {cheapest['月額']}万円）"
+        cheapest = candidates.loc[candidates["月額_中央値"].idxmin()]
+        cheapest_station = format_station_cost(cheapest)
 
         # 最も高い駅
-        most_expensive = filtered_data.loc[filtered_data["月額"].idxmax()]
-        most_expensive_station = f"{most_expensive['駅名']}（月額: {most_expensive['月額']}万円）"
+        most_expensive = candidates.loc[candidates["月額_中央値"].idxmax()]
+        most_expensive_station = format_station_cost(most_expensive)
     else:
         cheapest_station = "データなし"
         most_expensive_station = "データなし"
 
-    # 地図の生成
-    if not filtered_data.empty:
-        fig = create_map_figure(filtered_data, map_state, color_by)
-    else:
-        fig = px.scatter_mapbox()
-        fig.update_layout(
-            paper_bgcolor="black",
-            mapbox=dict(
-                center=map_state["center"],
-                zoom=map_state["zoom"]
-            )
-        )
+    return table_children, cheapest_station, most_expensive_station
 
-    return fig, map_state, table_children, cheapest_station, most_expensive_station
+# 建物種別とスライダーの目盛りの全組み合わせの応答（地図は初期表示範囲）を先に作っておく
+def prewarm_responses():
+    start = time.perf_counter()
+    map_view = initial_map_view(initial_view)
+    for building_type in get_building_type_options():
+        for minutes in get_time_limit_marks():
+            for transfers in get_transfer_limit_marks():
+                update_map(building_type["value"], minutes, transfers, map_view, initial_view)
+                update_summary(building_type["value"], minutes, transfers)
+    print(f"Prewarmed {response_cache.summary()} in {time.perf_counter() - start:.1f}s")
 
 # アプリケーション実行
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--prewarm", action="store_true", help="起動時にフィルタの目盛りの組み合わせの応答をキャッシュする")
+    args = parser.parse_args()
+    if args.prewarm:
+        prewarm_responses()
     app.run_server(debug=True)
\ No newline at end of file
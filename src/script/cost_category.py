@@ -0,0 +1,24 @@
+import numpy as np
+import pandas as pd
+
+# 月額（万円）の色分け用カテゴリ
+# 8以下 / 8超～9以下 … 18超～19以下（8超18以下は整数部で区切る）/ 18以上 / 不明（欠損）
+lower_threshold = 8
+upper_threshold = 18
+monthly_cost_labels = (
+    [f"{lower_threshold}以下"]
+    + [f"{n}超～{n + 1}以下" for n in range(lower_threshold, upper_threshold + 1)]
+    + [f"{upper_threshold}以上", "不明"]
+)
+
+
+# 月額をカテゴリ（category型）に振り分ける
+def monthly_cost_category(values):
+    values = pd.Series(values, dtype="float64")
+    x = values.to_numpy()
+    # 整数の区切りに対する位置（8未満:0, 8以上9未満:1, … 18以上:11）
+    codes = np.digitize(x, np.arange(lower_threshold, upper_threshold + 1))
+    codes = np.where(x <= lower_threshold, 0, codes)
+    codes = np.where(x > upper_threshold, len(monthly_cost_labels) - 2, codes)
+    codes = np.where(np.isnan(x), len(monthly_cost_labels) - 1, codes)
+    return pd.Series(pd.Categorical.from_codes(codes, categories=monthly_cost_labels), index=values.index)
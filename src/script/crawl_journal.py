@@ -0,0 +1,102 @@
+import os
+import json
+import pandas as pd
+
+# 地域ごとの追記専用ジャーナルとチェックポイント
+# journal.jsonl には1行1ページ（{"page": n, "rows": [...]}）をページ順に追記し、
+# checkpoint.json に書き込み済みの最終ページを記録する
+columns = ["建物種別", "建物名", "路線情報", "駅名", "賃料", "管理費", "月額"]
+numeric_columns = ["賃料", "管理費", "月額"]
+
+
+class CrawlJournal:
+    def __init__(self, region_dir):
+        self.region_dir = region_dir
+        self.journal_path = os.path.join(region_dir, "journal.jsonl")
+        self.checkpoint_path = os.path.join(region_dir, "checkpoint.json")
+        os.makedirs(region_dir, exist_ok=True)
+        self.checkpoint = self._read_checkpoint()
+
+    def _read_checkpoint(self):
+        if not os.path.exists(self.checkpoint_path):
+            return {"last_page": 0, "complete": False}
+        with open(self.checkpoint_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_checkpoint(self):
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.checkpoint, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    # 書き込み済みの最終ページ（再開時はこの次から取得）
+    @property
+    def last_page(self):
+        return self.checkpoint["last_page"]
+
+    @property
+    def complete(self):
+        return self.checkpoint["complete"]
+
+    # 新規クロールとして初期化
+    def reset(self):
+        for path in (self.journal_path, self.checkpoint_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self.checkpoint = {"last_page": 0, "complete": False}
+
+    # 1ページ分を追記してチェックポイントを進める
+    def append_page(self, page, rows):
+        # 途中で落ちた書き込みの残りがあれば行を区切る
+        if os.path.exists(self.journal_path) and os.path.getsize(self.journal_path) > 0:
+            with open(self.journal_path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b"\n"
+        else:
+            needs_newline = False
+
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            if needs_newline:
+                f.write("\n")
+            f.write(json.dumps({"page": page, "rows": rows}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.checkpoint["last_page"] = page
+        self._write_checkpoint()
+
+    # 最終ページまで取得済みとして記録
+    def mark_complete(self):
+        self.checkpoint["complete"] = True
+        self._write_checkpoint()
+
+    # チェックポイント済みのページを順番に返す（重複・書きかけの行は読み飛ばす）
+    def iter_pages(self):
+        if not os.path.exists(self.journal_path):
+            return
+        last_emitted = 0
+        with open(self.journal_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                page = entry["page"]
+                if page <= last_emitted or page > self.last_page:
+                    continue
+                last_emitted = page
+                yield page, entry["rows"]
+
+    # ジャーナルからページ単位でCSVを書き出す（全行をメモリに載せない）
+    def export_csv(self, output_file):
+        row_count = 0
+        with open(output_file, "w", encoding="utf-8-sig", newline="") as f:
+            pd.DataFrame(columns=columns).to_csv(f, index=False)
+            for _, rows in self.iter_pages():
+                if not rows:
+                    continue
+                df = pd.DataFrame(rows, columns=columns)
+                df[numeric_columns] = df[numeric_columns].astype(float)
+                df.to_csv(f, index=False, header=False)
+                row_count += len(df)
+        return row_count
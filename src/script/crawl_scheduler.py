@@ -0,0 +1,216 @@
+import time
+import queue
+import threading
+from urllib.parse import urlsplit
+
+retry_delay = 5.0  # 取得に失敗したページを再試行するまでの待ち時間（秒、連続失敗ごとに倍）
+max_retry_delay = 60.0
+
+
+# 連続失敗回数に応じた再試行までの待ち時間
+def retry_backoff(errors):
+    return min(max_retry_delay, retry_delay * 2 ** (errors - 1))
+
+
+# 地域ごとのクロール状態
+class RegionState:
+    def __init__(self, name, url, start_page=1):
+        self.name = name
+        self.url = url
+        self.next_page = start_page
+        self.next_emit = start_page  # 次にon_pageへ渡すページ番号
+        self.end_page = None  # 最終ページの次のページ番号（判明したら設定）
+        self.in_flight = 0  # 取得中・再試行待ちのページ数
+        self.pending = {}  # 順番待ちのページ（next_emit から先読み数の範囲にしか溜まらない）
+        self.consecutive_errors = 0
+        # 連続エラーで打ち切ったページ（先読みで最終ページより後のページが失敗した場合もあるので、
+        # end_page がこのページのとき＝最終ページに達する前に打ち切ったときだけ地域の失敗とする）
+        self.failed_page = None
+        self.done = False
+        self.emit_lock = threading.Lock()  # on_page をページ順に呼ぶためのロック
+
+
+# (地域, ページ) ジョブを共有キューで複数ワーカーに配るスケジューラ
+# 取得結果はページ順にon_pageへ渡し、スケジューラ自身は保持しない。
+# 取得に失敗したページは渡さずに待ってから取り直すので、チェックポイントが失敗ページを越えることはない
+class CrawlScheduler:
+    def __init__(self, region_urls, open_session, fetch_page, close_session=None,
+                 workers=4, per_host_limit=4, window=None, on_page=None, on_region_done=None,
+                 on_region_failed=None, start_pages=None, max_consecutive_errors=5):
+        self.open_session = open_session
+        self.fetch_page = fetch_page
+        self.close_session = close_session
+        self.workers = max(1, workers)
+        self.per_host_limit = max(1, per_host_limit)
+        # 1地域あたりの先読みページ数（最終ページ以降の無駄な取得はこの数-1まで）
+        self.window = window or self.workers
+        self.on_page = on_page
+        self.on_region_done = on_region_done
+        self.on_region_failed = on_region_failed
+        # 連続してこの数だけ取得に失敗した地域は打ち切る
+        self.max_consecutive_errors = max_consecutive_errors
+
+        start_pages = start_pages or {}
+        self.regions = {
+            name: RegionState(name, url, start_pages.get(name, 1)) for name, url in region_urls.items()
+        }
+        self.jobs = queue.Queue()
+        self.lock = threading.Lock()
+        self.outstanding = 0
+        self.session_errors = []
+        self.failed_regions = []  # 連続エラーで打ち切った地域（最終ページまで取得していない）
+        self.host_slots = {}
+        for state in self.regions.values():
+            host = urlsplit(state.url).netloc
+            if host not in self.host_slots:
+                self.host_slots[host] = threading.BoundedSemaphore(self.per_host_limit)
+
+    # ジョブ投入（lock取得済みで呼ぶこと）
+    def _enqueue(self, state):
+        page = state.next_page
+        state.next_page += 1
+        state.in_flight += 1
+        self.outstanding += 1
+        self.jobs.put((state.name, page))
+
+    # 先読み数まで次のページを投入（lock取得済みで呼ぶこと）
+    # 先頭のページが再試行待ちの間は後続のページが溜まるだけなので、next_emit からの範囲で打ち止めにする
+    def _fill_window(self, state):
+        while state.end_page is None and state.next_page - state.next_emit < self.window:
+            self._enqueue(state)
+
+    # ページ順に渡せる連続したページを取り出す（lock取得済みで呼ぶこと）
+    def _take_ready(self, state):
+        ready = []
+        while state.next_emit in state.pending:
+            rows = state.pending.pop(state.next_emit)
+            if state.end_page is None or state.next_emit < state.end_page:
+                ready.append((state.next_emit, rows))
+            state.next_emit += 1
+        self._fill_window(state)
+        return ready
+
+    # 順番の来たページをon_pageへ渡す（ジャーナルの書き込みは全体のlockの外で行う）
+    # 地域ごとのemit_lockの中で取り出しと書き込みをするので、ページ順は崩れない
+    def _emit(self, state):
+        finished = False
+        with state.emit_lock:
+            with self.lock:
+                ready = self._take_ready(state)
+            for page, rows in ready:
+                if self.on_page:
+                    self.on_page(state.name, page, rows)
+            with self.lock:
+                # 最終ページの手前まですべて渡し終えたら地域の完了
+                if (state.end_page is not None and state.in_flight == 0 and state.next_emit >= state.end_page
+                        and not state.done):
+                    state.done = True
+                    finished = True
+        if finished and state.failed_page == state.end_page:
+            # 打ち切った地域は完了扱いにしない（失敗したページの手前までをon_pageへ渡し済み）
+            print(f"Stopped {state.name} before page {state.end_page}")
+            with self.lock:
+                self.failed_regions.append(state.name)
+            if self.on_region_failed:
+                self.on_region_failed(state.name, state.end_page)
+        elif finished:
+            print(f"Reached last page for {state.name}. Total pages: {state.end_page - 1}")
+            if self.on_region_done:
+                self.on_region_done(state.name, state.end_page)
+
+    # ページ取得結果の反映
+    def _complete(self, state, page, rows):
+        with self.lock:
+            state.in_flight -= 1
+            if rows is None:
+                # 最終ページを超えた
+                if state.end_page is None or page < state.end_page:
+                    state.end_page = page
+            elif state.end_page is None or page < state.end_page:
+                state.pending[page] = rows
+
+        self._emit(state)
+
+        # 次のページの投入（_emit内）が済んでから完了数に数える
+        with self.lock:
+            self.outstanding -= 1
+            if self.outstanding == 0:
+                # 全ジョブ完了、ワーカーを停止
+                for _ in range(self.workers):
+                    self.jobs.put(None)
+
+    # ページ取得の失敗を反映し、再試行するまでの待ち時間を返す（打ち切る場合はNone）
+    def _fail(self, state, page, error):
+        with self.lock:
+            state.consecutive_errors += 1
+            errors = state.consecutive_errors
+        print(f"Error on page {page} of {state.name} ({errors}/{self.max_consecutive_errors}): {error}")
+        if errors >= self.max_consecutive_errors:
+            print(f"Giving up {state.name} after {errors} consecutive errors")
+            with self.lock:
+                if state.failed_page is None or page < state.failed_page:
+                    state.failed_page = page
+            return None
+        return retry_backoff(errors)
+
+    # ワーカースレッド本体
+    def _worker(self):
+        try:
+            session = self.open_session()
+        except Exception as e:
+            print(f"Failed to open session: {e}")
+            with self.lock:
+                self.session_errors.append(e)
+            return
+        try:
+            while True:
+                job = self.jobs.get()
+                if job is None:
+                    break
+
+                region_name, page = job
+                state = self.regions[region_name]
+                if state.end_page is not None and page >= state.end_page:
+                    self._complete(state, page, None)
+                    continue
+
+                url = f"{state.url}{page}"
+                slot = self.host_slots[urlsplit(state.url).netloc]
+                try:
+                    with slot:
+                        rows = self.fetch_page(session, url)
+                except Exception as e:
+                    delay = self._fail(state, page, e)
+                    if delay is not None:
+                        # 同じページを取り直す（ジョブは未完了のまま、先読み数にも数えたまま）
+                        time.sleep(delay)
+                        self.jobs.put(job)
+                        continue
+                    # 打ち切り：失敗したページの手前までで地域を終える（最終ページより前なら完了にはしない）
+                    rows = None
+                else:
+                    with self.lock:
+                        state.consecutive_errors = 0
+                self._complete(state, page, rows)
+        finally:
+            if self.close_session:
+                self.close_session(session)
+
+    # クロール実行
+    def run(self):
+        with self.lock:
+            for state in self.regions.values():
+                self._fill_window(state)
+            if self.outstanding == 0:
+                for _ in range(self.workers):
+                    self.jobs.put(None)
+
+        threads = [threading.Thread(target=self._worker, daemon=True) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # 全ワーカーがセッションを開けなかった場合は失敗とする
+        if len(self.session_errors) == self.workers:
+            raise self.session_errors[0]
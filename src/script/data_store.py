@@ -0,0 +1,156 @@
+import os
+import pandas as pd
+import pyarrow.parquet as pq
+
+# ステージ間の中間データ（型付き・辞書エンコードのParquet）
+# 文字列の種類が少ない列は category 型にして辞書エンコードで保存し、
+# 読み込み時は各ステージが必要な列だけを読む。Parquetがなければ従来のCSVを読む
+output_dir = "./output"
+
+reachable_schema = {
+    "駅名": "string",
+    "所要時間範囲": "category",
+    "所要時間": "category",
+    "乗り換え回数": "category",
+    "路線名": "category",
+}
+station_schema = {
+    "駅名_cleaned": "string",
+    "station_cd": "Int64",
+    "station_name": "string",
+    "address": "string",
+    "lon": "float64",
+    "lat": "float64",
+    "company": "category",
+    "line_name": "category",
+}
+# 所要時間・乗り換え回数の数値列（navitime_parser.commute_columns）
+commute_schema = {
+    "所要分": "Int16",
+    "乗換回数": "Int8",
+}
+rent_schema = {
+    "建物種別": "category",
+    "建物名": "string",
+    "路線情報": "string",
+    "駅名": "category",
+    "賃料": "float64",
+    "管理費": "float64",
+    "月額": "float64",
+}
+
+# 建物種別・駅名ごとの月額統計
+cost_stats_schema = {
+    "件数": "Int32",
+    "月額": "float64",
+    "月額_p10": "float64",
+    "月額_中央値": "float64",
+    "月額_p90": "float64",
+    "月額_最小": "float64",
+    "月額_最大": "float64",
+    "賃料_平均": "float64",
+    "管理費_平均": "float64",
+    "管理費率": "float32",
+}
+
+# データセットごとの保存先（拡張子なし）とスキーマ
+datasets = {
+    "reachable_stations": {
+        "path": os.path.join(output_dir, "reachable_stations"),
+        "schema": reachable_schema,
+    },
+    "rail_reachable_stations": {
+        "path": os.path.join(output_dir, "rail_reachable_stations"),
+        "schema": reachable_schema,
+    },
+    "final_reachable_stations": {
+        "path": os.path.join(output_dir, "final_reachable_stations"),
+        "schema": {**reachable_schema, **commute_schema, **station_schema},
+    },
+    "merged_data": {
+        "path": os.path.join(output_dir, "merged_data"),
+        "schema": rent_schema,
+    },
+    "canonical_listings": {
+        "path": os.path.join(output_dir, "canonical_listings"),
+        "schema": {**rent_schema, "重複件数": "Int32"},
+    },
+    "average_monthly_cost": {
+        "path": os.path.join(output_dir, "average_monthly_cost_by_building_and_station"),
+        "schema": {"建物種別": "category", "駅名": "category", "月額": "float64"},
+    },
+    "monthly_cost_stats": {
+        "path": os.path.join(output_dir, "monthly_cost_stats_by_building_and_station"),
+        "schema": {"建物種別": "category", "駅名": "category", **cost_stats_schema},
+    },
+    "station_dimension": {
+        "path": os.path.join(output_dir, "station_dimension"),
+        "schema": {**reachable_schema, **commute_schema, **station_schema},
+    },
+    "rent_fact": {
+        "path": os.path.join(output_dir, "rent_fact"),
+        "schema": {"station_cd": "Int64", "建物種別": "category", **cost_stats_schema, "月額カテゴリ": "category"},
+    },
+    "joined_data": {
+        "path": os.path.join(output_dir, "joined_data"),
+        "schema": {**reachable_schema, **station_schema, "建物種別": "category", **cost_stats_schema,
+                   "月額カテゴリ": "category"},
+    },
+}
+
+
+def parquet_path(name):
+    return datasets[name]["path"] + ".parquet"
+
+def csv_path(name):
+    return datasets[name]["path"] + ".csv"
+
+# スキーマに沿って型を揃える（スキーマにない列はそのまま）
+def apply_schema(df, name):
+    schema = datasets[name]["schema"]
+    dtypes = {column: dtype for column, dtype in schema.items() if column in df.columns}
+    return df.astype(dtypes)
+
+# データセットを保存（csv=Trueなら従来形式のCSVも出力）
+def write_dataset(df, name, csv=False):
+    df = apply_schema(df, name)
+    path = parquet_path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    df.to_parquet(path, index=False, compression="zstd")
+    if csv:
+        df.to_csv(csv_path(name), index=False, encoding="utf-8-sig")
+    return path
+
+# データセットを読み込む（columnsを指定するとその列だけを読む）
+def read_dataset(name, columns=None):
+    if os.path.exists(parquet_path(name)):
+        return pd.read_parquet(parquet_path(name), columns=columns)
+    df = pd.read_csv(csv_path(name), usecols=columns)
+    return apply_schema(df, name)
+
+# データセットをchunksize行ずつ読み込む（全体をメモリに載せない）
+def iter_dataset(name, columns=None, chunksize=100000):
+    if os.path.exists(parquet_path(name)):
+        for batch in pq.ParquetFile(parquet_path(name)).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+        return
+    for chunk in pd.read_csv(csv_path(name), usecols=columns, chunksize=chunksize):
+        yield apply_schema(chunk, name)
+
+# データセットの列名（従来のCSVには後から追加した列がないことがある）
+def dataset_columns(name):
+    if os.path.exists(parquet_path(name)):
+        return pq.read_schema(parquet_path(name)).names
+    return pd.read_csv(csv_path(name), nrows=0).columns.tolist()
+
+# データセットが存在するか（ParquetかCSVのどちらか）
+def dataset_exists(name):
+    return os.path.exists(parquet_path(name)) or os.path.exists(csv_path(name))
+
+# データセットのバージョン（ファイルのパス・サイズ・更新時刻、更新検知用）
+def dataset_version(name):
+    path = parquet_path(name) if os.path.exists(parquet_path(name)) else csv_path(name)
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return (path, stat.st_size, stat.st_mtime_ns)
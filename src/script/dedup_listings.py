@@ -0,0 +1,124 @@
+import time
+import argparse
+import difflib
+import numpy as np
+import pandas as pd
+from data_store import read_dataset, write_dataset, dataset_exists
+
+# 複数の不動産会社が掲載した同じ部屋（重複物件）をまとめて、1募集1行の物件表を作る
+# 1. 建物名・路線情報を正規化し、(建物種別, 駅名, 建物名, 路線情報, 賃料, 管理費) のハッシュが同じ行を1グループにする
+# 2. 駅名と建物名の先頭 block_prefix 文字でブロックに分け、ブロック内で建物種別・賃料・管理費と建物名中の数字
+#    （「7階建 新築」のような建物名を伏せた表記の階数・築年数）が同じグループ同士だけを文字列の類似度で比べ、
+#    ほぼ同じ（表記ゆれなど）ならまとめる（全ペア比較をしないのでほぼ線形時間）
+#
+# 重複の扱い（方針はここにまとめる）
+# - 取得したデータ（scraped_data.csv・listing_index・履歴スナップショット・merged_data）はページの行をそのまま持ち、
+#   同じ建物で賃料・管理費も同じ部屋も別の行として残す（差分クロールと全件クロールの結果を一致させるため）
+# - 重複をまとめるのはこの物件表だけ。掲載した会社も部屋番号・階数もデータにないので、複数社が載せた同じ部屋と
+#   1社が載せた条件の同じ別の部屋は区別できず、どちらも1件（重複件数＝まとめた行数）とする
+# - month_const の件数・月額の統計はこの物件表から作るので、条件の同じ部屋は1件と数える
+listing_columns = ["建物種別", "建物名", "路線情報", "駅名", "賃料", "管理費", "月額"]
+block_prefix = 4  # ブロック分けに使う建物名の先頭文字数
+name_similarity = 0.9  # 建物名の類似度（difflib）がこれ以上で、
+route_similarity = 0.7  # 路線情報の類似度もこれ以上なら同じ物件（路線の書き方・徒歩分数の違いは許す）
+max_block_pairs = 10000  # 1つの比較グループでこれ以上のペアになる場合は類似度の比較を省く
+
+# 表記ゆれを除いた比較用の文字列（全角/半角・大文字/小文字・空白・記号・「(仮称)」を統一）
+def normalize_listing_text(values):
+    values = values.astype("string").fillna("").str.normalize("NFKC").str.lower()
+    values = values.str.replace(r"\(仮称\)", "", regex=True)
+    return values.str.replace(r"[\s・,、.。\-‐－―_()\[\]【】「」/]", "", regex=True)
+
+# 2つの文字列の類似度が threshold 以上か（上限の見積もり quick_ratio で先に除外する）
+def is_similar(a, b, threshold):
+    if a == b:
+        return True
+    matcher = difflib.SequenceMatcher(None, a, b, autojunk=False)
+    return matcher.quick_ratio() >= threshold and matcher.ratio() >= threshold
+
+# 素集合（Union-Find）
+class DisjointSet:
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, item):
+        root = item
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[item] != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[max(root_a, root_b)] = min(root_a, root_b)
+
+# 行ごとの重複グループ番号（同じ物件の行は同じ番号、番号はグループの最初の行の順）
+def duplicate_groups(df):
+    name_key = normalize_listing_text(df["建物名"])
+    route_key = normalize_listing_text(df["路線情報"])
+    keys = pd.DataFrame({
+        "建物種別": df["建物種別"].astype("string").fillna(""),
+        "駅名": df["駅名"].astype("string").fillna(""),
+        "name": name_key,
+        "route": route_key,
+        # 金額は万円の小数第2位まで（表示上の丸めの違いを吸収）
+        "賃料": df["賃料"].astype(float).round(2),
+        "管理費": df["管理費"].astype(float).round(2),
+    }).reset_index(drop=True)
+
+    # 1. 正規化した値のハッシュが同じ行（完全一致）
+    exact_hash = pd.util.hash_pandas_object(keys, index=False).to_numpy()
+    exact_ids, _ = pd.factorize(exact_hash)
+    representatives = keys.groupby(exact_ids, sort=True).head(1).copy()
+    representatives["exact_id"] = exact_ids[representatives.index]
+    representatives["block"] = representatives["name"].str[:block_prefix]
+    representatives["digits"] = representatives["name"].str.replace(r"\D", "", regex=True)
+
+    # 2. 駅名・建物名の先頭でブロック分けし、建物種別・賃料・管理費・建物名中の数字が同じグループ同士を類似度で比べる
+    groups = DisjointSet(len(representatives))
+    names = representatives["name"].tolist()
+    routes = representatives["route"].tolist()
+    ids = representatives["exact_id"].tolist()
+    candidate_keys = ["駅名", "block", "建物種別", "賃料", "管理費", "digits"]
+    for rows in representatives.groupby(candidate_keys, sort=False, dropna=False).indices.values():
+        if len(rows) < 2 or len(rows) * (len(rows) - 1) // 2 > max_block_pairs:
+            continue
+        for i, a in enumerate(rows):
+            for b in rows[i + 1:]:
+                if is_similar(names[a], names[b], name_similarity) and is_similar(routes[a], routes[b], route_similarity):
+                    groups.union(ids[a], ids[b])
+
+    roots = np.array([groups.find(exact_id) for exact_id in range(len(representatives))], dtype=np.int64)
+    return roots[exact_ids]
+
+# 重複をまとめた物件表（各グループの最初の行を代表とし、重複件数＝同じ物件の掲載数）
+def canonical_listings(df):
+    df = df.reset_index(drop=True)
+    group_ids = duplicate_groups(df)
+    canonical = df.groupby(group_ids, sort=True).head(1).copy()
+    canonical["重複件数"] = np.bincount(group_ids)[group_ids[canonical.index]]
+    return canonical.reset_index(drop=True)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", action="store_true", help="Parquetに加えてCSVも出力する")
+    args = parser.parse_args()
+
+    if not dataset_exists("merged_data"):
+        print("Merged data file not found!")
+        return
+
+    df = read_dataset("merged_data", columns=listing_columns)
+    start = time.perf_counter()
+    canonical = canonical_listings(df)
+    elapsed = time.perf_counter() - start
+
+    output_file = write_dataset(canonical, "canonical_listings", csv=args.csv)
+    duplicated = int((canonical["重複件数"] > 1).sum())
+    print(f"Saved canonical listings to {output_file}: {len(df)} rows -> {len(canonical)} listings "
+          f"({duplicated} listed more than once, {elapsed:.2f}s)")
+
+if __name__ == "__main__":
+    main()
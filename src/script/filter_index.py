@@ -0,0 +1,73 @@
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+# 所要分・乗換回数の上限で絞り込むインデックス
+# 乗換回数ごとに所要分の昇順に並べた行位置を起動時に作り、「N分以内・K回以内」は
+# 乗換回数ごとの二分探索で先頭から何行かを決めるだけで解決する（文字列の比較をしない）
+class CommuteIndex:
+    def __init__(self, minutes, transfers):
+        minutes = pd.array(minutes, dtype="Int64")
+        transfers = pd.array(transfers, dtype="Int64")
+        valid = ~(pd.isna(minutes) | pd.isna(transfers))
+        minutes = minutes.to_numpy(dtype=np.int64, na_value=0)
+        transfers = transfers.to_numpy(dtype=np.int64, na_value=0)
+
+        self.size = len(minutes)
+        self.transfer_values = sorted(set(transfers[valid].tolist()))
+        self.positions = {}  # 乗換回数 -> 所要分の昇順に並べた行位置
+        self.sorted_minutes = {}  # 乗換回数 -> 並べた後の所要分
+        for value in self.transfer_values:
+            rows = np.flatnonzero(valid & (transfers == value))
+            rows = rows[np.argsort(minutes[rows], kind="stable")]
+            self.positions[value] = rows
+            self.sorted_minutes[value] = minutes[rows]
+
+    # 所要分が max_minutes 以下、乗換回数が max_transfers 以下の行の位置（行の順。Noneなら上限なし）
+    def select(self, max_minutes=None, max_transfers=None):
+        parts = []
+        for value in self.transfer_values:
+            if max_transfers is not None and value > max_transfers:
+                break
+            end = len(self.positions[value]) if max_minutes is None else np.searchsorted(
+                self.sorted_minutes[value], max_minutes, side="right"
+            )
+            parts.append(self.positions[value][:end])
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate(parts))
+
+# コールバックの処理時間の記録（log_interval回ごとに中央値・p95・最大を表示）
+class LatencyLog:
+    def __init__(self, name, log_interval=20, window=200):
+        self.name = name
+        self.log_interval = log_interval
+        self.samples = deque(maxlen=window)
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        with self.lock:
+            self.samples.append(seconds * 1000)
+            self.calls += 1
+            if self.calls % self.log_interval == 0:
+                print(self.summary())
+
+    def summary(self):
+        samples = np.array(self.samples)
+        if len(samples) == 0:
+            return f"[{self.name}] no calls"
+        return (f"[{self.name}] {self.calls} calls, median {np.median(samples):.1f}ms, "
+                f"p95 {np.percentile(samples, 95):.1f}ms, max {samples.max():.1f}ms")
+
+    # with文で囲んだ区間の時間を記録する
+    @contextmanager
+    def measure(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(time.perf_counter() - start)
@@ -1,47 +1,55 @@
+import argparse
 import pandas as pd
-import re
+from data_store import read_dataset, write_dataset
+from station_index import load_station_index, match_station_names
+from station_spatial_index import load_spatial_index
+from navitime_parser import commute_columns
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--csv", action="store_true", help="突合結果をParquetに加えてCSVでも出力する")
+args = parser.parse_args()
 
 # ファイルパスの設定
-reachable_stations_file = "./output/reachable_stations.csv"  # スクレイピング結果のCSV
 station_data_file = "./src/data/station20240426free.csv"    # 元データのCSV
 output_file = "./output/cleaned_station_data.csv"           # クリーンデータの出力先
-final_output_file = "./output/final_reachable_stations.csv" # 突合結果の出力先
+unmatched_output_file = "./output/unmatched_stations.csv"   # 突合しなかった駅名の出力先
+
+# 出発駅の座標（同名駅は近い方を採用する）
+origin_coords = (139.7407, 35.6355)  # 高輪ゲートウェイ
 
 # ファイルの読み込み
-reachable_stations = pd.read_csv(reachable_stations_file)  # スクレイピング結果
-station_data = pd.read_csv(
-    station_data_file,
-    usecols=["station_name", "address", "lon", "lat"]
-)  # 必要な列のみ読み込み
+reachable_stations = read_dataset("reachable_stations")  # スクレイピング結果
+station_data = load_station_index(station_data_file)  # 駅名インデックス（ディスクにキャッシュ）
+spatial_index = load_spatial_index(station_data_file)  # 駅座標の空間インデックス（ディスクにキャッシュ）
 
 # 位置フィルタリング（指定された範囲内のデータのみ）
-station_data = station_data[(
-    (station_data["lon"] >= 139.357090) &
-    (station_data["lon"] <= 140.972770) &
-    (station_data["lat"] >= 35.270070) &
-    (station_data["lat"] <= 36.322553)
-)]
+stations_in_area = spatial_index.bbox(139.357090, 35.270070, 140.972770, 36.322553)
+station_data = station_data[station_data["station_cd"].isin(stations_in_area)]
+
+# 所要時間・乗り換え回数を数値にする（所要時間範囲に収まらない所要時間は範囲の上限で代用）
+commute, substituted = commute_columns(reachable_stations)
+reachable_stations[["所要分", "乗換回数"]] = commute
 
 # reachable_stationsの駅名から括弧とそれ以降を除去
-reachable_stations["駅名_cleaned"] = reachable_stations["駅名"].apply(
-    lambda x: re.sub(r"\s*\(.*\)|\s*（.*）|\s*\[.*\]|\s*〔.*〕", "", x) if isinstance(x, str) else x
+reachable_stations["駅名_cleaned"] = reachable_stations["駅名"].str.replace(
+    r"\s*\(.*\)|\s*（.*）|\s*\[.*\]|\s*〔.*〕", "", regex=True
 )
 
-# 駅名でフィルタリング
-filtered_stations = station_data[station_data["station_name"].isin(reachable_stations["駅名_cleaned"])]
-
-# 重複データを削除（最初のレコードだけを残す）
-filtered_stations = filtered_stations.drop_duplicates(subset=["station_name"], keep="first")
+# 駅名ごとに駅を1つ選ぶ（括弧内の都道府県を優先し、表記ゆれは正規化・類似度で吸収）
+filtered_stations = match_station_names(reachable_stations["駅名"], station_data, origin=origin_coords)
 
 # 突合結果をreachable_stationsに結合
 merged_stations = pd.merge(
     reachable_stations,
-    filtered_stations,
-    left_on="駅名_cleaned",
-    right_on="station_name",
+    filtered_stations[["駅名", "station_cd", "station_name", "address", "lon", "lat"]],
+    on="駅名",
     how="left"
 )
 
+# 突合しなかった駅名を出力
+unmatched = merged_stations.loc[merged_stations["lat"].isna(), "駅名"].drop_duplicates()
+unmatched.to_frame("突合しなかった駅名").to_csv(unmatched_output_file, index=False, encoding="utf-8-sig")
+
 # latとlonが存在しない場合、行を削除
 merged_stations = merged_stations.dropna(subset=["lat", "lon"])
 
@@ -136,9 +144,11 @@ merged_stations = pd.merge(
 # 不要な列を削除
 merged_stations = merged_stations.drop(columns=["line"])
 
-# CSV出力
-merged_stations.to_csv(final_output_file, index=False, encoding="utf-8-sig")
+# 保存（Parquet、指定があればCSVも）
+final_output_file = write_dataset(merged_stations, "final_reachable_stations", csv=args.csv)
 
 # ログ出力
 print(f"路線データが作成されました")
 print(f"突合結果が作成されました: {final_output_file}")
+print(f"突合しなかった駅名: {len(unmatched)}件 ({unmatched_output_file})")
+print(f"所要時間を時間範囲の上限で代用した行: {substituted.sum()}件")
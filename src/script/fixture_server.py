@@ -0,0 +1,95 @@
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+# ベンチマーク・オフライン確認用のSUUMO風一覧ページを返すローカルサーバー
+
+building_types = ["賃貸マンション", "賃貸アパート", "賃貸一戸建て"]
+stations = [
+    ("ＪＲ山手線", "品川"), ("ＪＲ山手線", "田町"), ("京急本線", "北品川"),
+    ("東急池上線", "五反田"), ("都営浅草線", "高輪台"), ("ＪＲ京浜東北線", "大井町"),
+]
+
+# 物件1件分のHTML
+def render_property(region, page, index, rooms_per_property):
+    seed = page * 131 + index * 17 + len(region)
+    building_type = building_types[seed % len(building_types)]
+    line, station = stations[seed % len(stations)]
+    rows = []
+    for room in range(rooms_per_property):
+        rent = 6.0 + ((seed + room * 7) % 150) / 10
+        fee = "-" if (seed + room) % 5 == 0 else f"{((seed + room) % 20) * 500:,}円"
+        rows.append(
+            "<tbody><tr class=\"js-cassette_link\">"
+            "<td class=\"ui-text--midium\"><input type=\"checkbox\"></td>"
+            f"<td>{room + 1}階</td>"
+            "<td></td>"
+            "<td><ul>"
+            f"<li><span class=\"cassetteitem_price cassetteitem_price--rent\"><span class=\"cassetteitem_other-emphasis ui-text--bold\">{rent:.1f}万円</span></span></li>"
+            f"<li><span class=\"cassetteitem_price cassetteitem_price--administration\">{fee}</span></li>"
+            "</ul></td>"
+            "</tr></tbody>"
+        )
+    return (
+        "<li><div class=\"cassetteitem\">"
+        "<div class=\"cassetteitem-detail\"><div class=\"cassetteitem_content\">"
+        f"<div class=\"cassetteitem_content-label\"><span class=\"ui-pct ui-pct--util1\">{building_type}</span></div>"
+        f"<div class=\"cassetteitem_content-title\">{region}レジデンス{page}-{index}</div>"
+        "<div class=\"cassetteitem_detail-col2\">"
+        f"<div class=\"cassetteitem_detail-text\">{line}/{station}駅 歩{seed % 15 + 1}分</div>"
+        "<div class=\"cassetteitem_detail-text\">ＪＲ山手線/東京駅 歩20分</div>"
+        "</div></div></div>"
+        f"<div class=\"cassetteitem-item\"><table class=\"cassetteitem_other\">{''.join(rows)}</table></div>"
+        "</div></li>"
+    )
+
+# 一覧ページ1枚分のHTML（総ページ数を超えるとエラー表示のみ）
+def render_listing_page(region, page, total_pages, properties_per_page=30, rooms_per_property=2):
+    if page > total_pages:
+        form = "<div class=\"error_pop error_pop--fr\"><div>該当する物件がありません</div></div>"
+        items = ""
+    else:
+        form = ""
+        items = "".join(render_property(region, page, i, rooms_per_property) for i in range(properties_per_page))
+    return (
+        "<html><head><meta charset=\"utf-8\"></head><body>"
+        f"<form id=\"js-leftColumnForm\">{form}</form>"
+        f"<div id=\"js-bukkenList\"><ul class=\"l-cassetteitem\">{items}</ul></div>"
+        "</body></html>"
+    )
+
+# サーバーを別スレッドで起動し、(server, 地域ごとのURL) を返す
+def start_fixture_server(pages_by_region, delay=0.0, properties_per_page=30):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            region = parts.path.strip("/")
+            if region not in pages_by_region:
+                self.send_error(404)
+                return
+            page = int(parse_qs(parts.query).get("page", ["1"])[0])
+
+            # ページ読み込み時間を模擬
+            if delay:
+                time.sleep(delay)
+
+            body = render_listing_page(region, page, pages_by_region[region], properties_per_page).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    host, port = server.server_address
+    urls = {region: f"http://{host}:{port}/{region}/?page=" for region in pages_by_region}
+    return server, urls
@@ -1,4 +1,3 @@
-import pandas as pd
 import dash
 from dash import dcc, html
 from dash.dependencies import Input, Output, State
@@ -6,6 +5,15 @@ import plotly.express as px
 import dash_bootstrap_components as dbc
 from dotenv import load_dotenv
 import os
+import time
+import argparse
+import threading
+from data_store import read_dataset, dataset_columns, dataset_version
+from navitime_parser import commute_columns
+from filter_index import CommuteIndex
+from response_cache import ResponseCache, with_viewport
+from map_figure import MapPoints, create_clustered_map_figure
+from map_clusters import ClusterGrid, initial_map_view, map_view_script
 
 # 環境変数からMapboxトークンを読み込み
 load_dotenv()
@@ -16,8 +24,40 @@ if not mapbox_token:
 px.set_mapbox_access_token(mapbox_token)
 
 # データの読み込み
-data = pd.read_csv("./output/final_reachable_stations.csv")
-data["company"] = data["company"].replace("不明", "その他")
+# 所要分・乗換回数のない従来のCSV（コミット済みの final_reachable_stations.csv など）は読み込み時に作る
+def load_data():
+    columns = ["駅名", "所要時間範囲", "所要時間", "乗り換え回数", "所要分", "乗換回数", "路線名", "lon", "lat", "company"]
+    available = dataset_columns("final_reachable_stations")
+    data = read_dataset("final_reachable_stations", columns=[column for column in columns if column in available])
+    if "所要分" not in data.columns or "乗換回数" not in data.columns:
+        commute, _ = commute_columns(data)
+        data = data.assign(所要分=commute["所要分"], 乗換回数=commute["乗換回数"])[columns]
+    data["company"] = data["company"].astype("string").replace("不明", "その他").astype("category")
+    return data
+
+data = load_data()
+data_version = dataset_version("final_reachable_stations")
+
+# 応答（図・路線表）はフィルタの組み合わせとデータのバージョン（図はさらにズームレベル・表示範囲）ごとにキャッシュする
+response_cache = ResponseCache(max_entries=128)
+reload_lock = threading.Lock()
+
+# final_reachable_stations が更新されていたらデータとキャッシュを作り直す
+def reload_if_changed():
+    global data, commute_index, map_points, cluster_grid, data_version
+    version = dataset_version("final_reachable_stations")
+    if version == data_version:
+        return
+    with reload_lock:
+        if version == data_version:
+            return
+        print("final_reachable_stations が更新されたため再読み込みします")
+        new_data = load_data()
+        data, commute_index, map_points, cluster_grid, data_version = (
+            new_data, CommuteIndex(new_data["所要分"], new_data["乗換回数"]), create_map_points(new_data),
+            ClusterGrid(new_data["lon"], new_data["lat"]), version
+        )
+        response_cache.clear()
 
 # カラーマッピング
 color_map = {
@@ -37,6 +77,8 @@ initial_view = {
     "center": {"lat": 35.68, "lon": 139.76},  # 東京駅付近
     "zoom": 10
 }
+# 図のuirevision（値が変わらない限りパン・ズームの状態が保たれる）
+map_uirevision = "map-view"
 
 # フィルタカードの作成
 def create_filter_card(title, children):
@@ -50,64 +92,38 @@ def create_filter_card(title, children):
         className="mb-4 bg-secondary shadow-sm"
     )
 
-# 所要時間範囲の選択肢生成
-def get_time_range_options():
-    return [
-        {"label": "10分まで", "value": "0-10分"},
-        {"label": "20分まで", "value": "0-10分,11-20分"},
-        {"label": "30分まで", "value": "0-10分,11-20分,21-30分"},
-        {"label": "40分まで", "value": "0-10分,11-20分,21-30分,31-40分"},
-        {"label": "50分まで", "value": "0-10分,11-20分,21-30分,31-40分,41-50分"},
-        {"label": "60分まで", "value": "0-10分,11-20分,21-30分,31-40分,41-50分,51-60分"}
-    ]
+# 所要時間の上限（分）のスライダーの目盛り
+def get_time_limit_marks():
+    return {minutes: f"{minutes}分" for minutes in range(10, 61, 10)}
 
-# 乗り換え回数の選択肢生成
-def get_transfer_options():
-    return [
-        {"label": "乗り換え0回", "value": "乗換0回"},
-        {"label": "乗り換え1回まで", "value": "乗換0回,乗換1回"},
-        {"label": "乗り換え2回まで", "value": "乗換0回,乗換1回,乗換2回"},
-        {"label": "乗り換え3回まで", "value": "乗換0回,乗換1回,乗換2回,乗換3回"}
-    ]
+# 乗り換え回数の上限のスライダーの目盛り
+def get_transfer_limit_marks():
+    return {transfers: f"{transfers}回" for transfers in range(0, 4)}
 
-# データのフィルタリング
-def filter_data(selected_time_ranges, selected_transfer_counts):
-    # 所要時間範囲と乗り換え回数でフィルタリング
-    time_ranges = selected_time_ranges.split(",") if selected_time_ranges else data["所要時間範囲"].unique()
-    transfer_counts = selected_transfer_counts.split(",") if selected_transfer_counts else data["乗り換え回数"].unique()
-    return data[
-        (data["所要時間範囲"].isin(time_ranges)) &
-        (data["乗り換え回数"].isin(transfer_counts))
-    ]
+# 所要分・乗換回数の上限で絞り込むインデックス
+commute_index = CommuteIndex(data["所要分"], data["乗換回数"])
+
+# データのフィルタリング（所要時間と乗り換え回数の上限、Noneなら上限なし）
+def filter_data(max_minutes, max_transfers):
+    return data.iloc[commute_index.select(max_minutes, max_transfers)]
 
-# 地図の生成
-def create_map_figure(filtered_data, map_state):
-    fig = px.scatter_mapbox(
-        filtered_data,
-        lat="lat",
-        lon="lon",
-        color="所要時間範囲",
-        color_discrete_map=color_map,
+# 地図の座標・ホバー表示・色分けを配列にしておく
+def create_map_points(data):
+    return MapPoints(
+        data,
         hover_name="駅名",
-        hover_data={
-            "所要時間": True,
-            "乗り換え回数": True,
-            "路線名": True,
-            "company": True
-        },
-        mapbox_style="carto-darkmatter"
+        hover_columns=["所要時間", "乗り換え回数", "路線名", "company"],
+        color_columns={"所要時間範囲": ("所要時間範囲", color_map)},
     )
-    fig.update_layout(
-        margin=dict(l=0, r=0, t=0, b=0),
-        paper_bgcolor="black",
-        mapbox=dict(
-            center=map_state["center"],
-            zoom=map_state["zoom"]
-        ),
-        showlegend=False  # 凡例を非表示
-    )
-    fig.update_traces(marker=dict(size=12))
-    return fig
+
+map_points = create_map_points(data)
+# ズームレベルごとのクラスタのセル
+cluster_grid = ClusterGrid(data["lon"], data["lat"])
+
+# 地図の生成（起動時に作った配列から、表示範囲内の点をズームレベルのセルごとにまとめて作る）
+def create_map_figure(filtered_data, map_state, map_view):
+    return create_clustered_map_figure(map_points, cluster_grid, filtered_data.index.to_numpy(), "所要時間範囲",
+                                       map_view, map_state, map_uirevision, mapbox_token)
 
 # アプリのレイアウト
 app.layout = dbc.Container(
@@ -117,21 +133,26 @@ app.layout = dbc.Container(
                 dbc.Col(
                     [
                         create_filter_card(
-                            "所要時間範囲",
-                            dcc.Dropdown(
-                                id="time-range-filter",
-                                options=get_time_range_options(),
-                                value="0-10分",  # 初期値を設定
-                                className="text-dark"
+                            "所要時間（上限）",
+                            dcc.Slider(
+                                id="max-minutes-filter",
+                                min=5,
+                                max=60,
+                                step=1,
+                                marks=get_time_limit_marks(),
+                                value=10,  # 初期値を設定
+                                tooltip={"placement": "bottom"}
                             )
                         ),
                         create_filter_card(
-                            "乗り換え回数",
-                            dcc.Dropdown(
-                                id="transfer-count-filter",
-                                options=get_transfer_options(),
-                                value="乗換0回",
-                                className="text-dark"
+                            "乗り換え回数（上限）",
+                            dcc.Slider(
+                                id="max-transfers-filter",
+                                min=0,
+                                max=3,
+                                step=1,
+                                marks=get_transfer_limit_marks(),
+                                value=0
                             )
                         ),
                         html.Div(id="route-table", className="mt-3"),  # フィルタ結果の表表示
@@ -152,36 +173,66 @@ app.layout = dbc.Container(
             ],
             className="g-0 bg-black"
         ),
-        dcc.Store(id="map-state", data=initial_view)  # 地図状態を保持するためのストレージ
+        dcc.Store(id="map-state", data=initial_view),  # 地図状態を保持するためのストレージ
+        dcc.Store(id="map-view", data=initial_map_view(initial_view)),  # クラスタのズームレベルと表示範囲
     ],
     fluid=True
 )
 
 
-# 路線名リストをスクロール可能な領域に表示するスタイルを追加
-@app.callback(
+# 地図の表示範囲の保存（ブラウザ側で処理し、ズームレベルが変わるか表示範囲が前回の範囲を出たときだけ map-view を更新する）
+app.clientside_callback(
+    map_view_script,
     [
-        Output("map-graph", "figure"),
         Output("map-state", "data"),
-        Output("route-table", "children")
+        Output("map-view", "data")
     ],
+    Input("map-graph", "relayoutData"),
     [
-        Input("time-range-filter", "value"),
-        Input("transfer-count-filter", "value"),
-        Input("map-graph", "relayoutData")
+        State("map-state", "data"),
+        State("map-view", "data")
+    ]
+)
+
+# フィルタかクラスタのズームレベル・表示範囲が変わったときに地図を作り直す（中心・ズームはStateとして読むだけ）
+@app.callback(
+    Output("map-graph", "figure"),
+    [
+        Input("max-minutes-filter", "value"),
+        Input("max-transfers-filter", "value"),
+        Input("map-view", "data")
     ],
     State("map-state", "data")
 )
-def update_map(selected_time_ranges, selected_transfer_counts, relayout_data, map_state):
-    # 地図状態を更新
-    if relayout_data:
-        if "mapbox.center" in relayout_data:
-            map_state["center"] = relayout_data["mapbox.center"]
-        if "mapbox.zoom" in relayout_data:
-            map_state["zoom"] = relayout_data["mapbox.zoom"]
+def update_map(max_minutes, max_transfers, map_view, map_state):
+    reload_if_changed()
+    view_key = (map_view["level"], tuple(round(value, 4) for value in map_view["bbox"]))
+    figure = response_cache.get_or_build(
+        ("figure", data_version, max_minutes, max_transfers, view_key),
+        lambda: create_map_figure(filter_data(max_minutes, max_transfers), initial_view, map_view),
+    )
+    return with_viewport(figure, map_state)
+
+# 路線名リストをスクロール可能な領域に表示するスタイルを追加
+# フィルタが変わったときだけ表を作り直す
+@app.callback(
+    Output("route-table", "children"),
+    [
+        Input("max-minutes-filter", "value"),
+        Input("max-transfers-filter", "value")
+    ]
+)
+def update_route_table(max_minutes, max_transfers):
+    reload_if_changed()
+    return response_cache.get_or_build(
+        ("table", data_version, max_minutes, max_transfers),
+        lambda: build_route_table(max_minutes, max_transfers),
+    )
 
+# 路線表の生成
+def build_route_table(max_minutes, max_transfers):
     # データをフィルタリング
-    filtered_data = filter_data(selected_time_ranges, selected_transfer_counts)
+    filtered_data = filter_data(max_minutes, max_transfers)
 
     # ユニークな路線名を取得して表形式で表示
     unique_routes = filtered_data["路線名"].unique()
@@ -197,24 +248,26 @@ def update_map(selected_time_ranges, selected_transfer_counts, relayout_data, ma
         ],
         style={"maxHeight": "300px", "overflowY": "scroll", "border": "1px solid #ccc"}
     )
+    return table_children
 
-    # 地図の生成
-    if not filtered_data.empty:
-        fig = create_map_figure(filtered_data, map_state)
-    else:
-        fig = px.scatter_mapbox()
-        fig.update_layout(
-            paper_bgcolor="black",
-            mapbox=dict(
-                center=map_state["center"],
-                zoom=map_state["zoom"]
-            )
-        )
-    return fig, map_state, table_children
+# スライダーの目盛りの全組み合わせの応答（地図は初期表示範囲）を先に作っておく
+def prewarm_responses():
+    start = time.perf_counter()
+    map_view = initial_map_view(initial_view)
+    for minutes in get_time_limit_marks():
+        for transfers in get_transfer_limit_marks():
+            update_map(minutes, transfers, map_view, initial_view)
+            update_route_table(minutes, transfers)
+    print(f"Prewarmed {response_cache.summary()} in {time.perf_counter() - start:.1f}s")
 
 
 # アプリケーション実行
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--prewarm", action="store_true", help="起動時にフィルタの目盛りの組み合わせの応答をキャッシュする")
+    args = parser.parse_args()
+    if args.prewarm:
+        prewarm_responses()
     app.run_server(debug=True)
     
     
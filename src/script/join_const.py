@@ -1,40 +1,62 @@
-import os
-import pandas as pd
+import argparse
+from data_store import read_dataset, write_dataset, dataset_exists
+from cost_category import monthly_cost_category
+from navitime_parser import commute_columns
 
 # 出力ディレクトリ
 output_dir = "./output"
 
-# ファイル名
-average_file = os.path.join(output_dir, "average_monthly_cost_by_building_and_station.csv")
-final_reachable_file = os.path.join(output_dir, "final_reachable_stations.csv")  # ファイル名をご確認ください
-output_file = os.path.join(output_dir, "joined_data.csv")
+# 駅ディメンション（station_cd ごとに1行）
+# 同じ駅に複数の経路（例: 町屋〔千代田線〕と町屋〔京成線〕）がある場合は所要時間・乗り換え回数が最小の経路を残す
+def build_station_dimension(final_reachable_df):
+    if "所要分" not in final_reachable_df.columns:
+        # 数値列がない従来のデータはここで作る
+        commute, _ = commute_columns(final_reachable_df)
+        final_reachable_df = final_reachable_df.assign(所要分=commute["所要分"], 乗換回数=commute["乗換回数"])
+    ranked = final_reachable_df.sort_values(["station_cd", "所要分", "乗換回数"], kind="stable")
+    stations = ranked.drop_duplicates(subset=["station_cd"], keep="first").sort_index()
+    return stations.reset_index(drop=True)
+
+# 家賃ファクト（station_cd・建物種別ごとに1行、月額の統計と色分け用の月額カテゴリ）
+def build_rent_fact(stats_df, stations):
+    rent = stats_df.rename(columns={"駅名": "駅名_cleaned"}).astype({"駅名_cleaned": "string"})
+    rent = rent.merge(stations[["駅名_cleaned", "station_cd"]], on="駅名_cleaned", how="inner")
+    rent["月額カテゴリ"] = monthly_cost_category(rent["月額"])
+    columns = ["station_cd"] + [column for column in rent.columns if column not in ("station_cd", "駅名_cleaned")]
+    return rent[columns]
 
 # レフトジョイン処理
-def left_join_data():
+def left_join_data(csv=False):
     # ファイルの存在確認
-    if not os.path.exists(average_file):
-        print(f"Average monthly cost file not found: {average_file}")
+    if not dataset_exists("monthly_cost_stats"):
+        print("Monthly cost stats data not found")
         return
-    if not os.path.exists(final_reachable_file):
-        print(f"Final reachable stations file not found: {final_reachable_file}")
+    if not dataset_exists("final_reachable_stations"):
+        print("Final reachable stations data not found")
         return
 
     # ファイル読み込み
-    average_df = pd.read_csv(average_file)
-    final_reachable_df = pd.read_csv(final_reachable_file)
-
-    # レフトジョインを実行（建物種別を除外し、駅名のみをキーにする）
-    joined_df = pd.merge(
-        final_reachable_df,
-        average_df.rename(columns={"駅名": "駅名_cleaned"}),  # 駅名を駅名_cleaned にリネームしてキーを一致
-        on="駅名_cleaned",
-        how="left"
-    )
-
-    # 出力
-    joined_df.to_csv(output_file, index=False, encoding="utf-8-sig")
+    stats_df = read_dataset("monthly_cost_stats")
+    final_reachable_df = read_dataset("final_reachable_stations")
+
+    # 駅ディメンションと家賃ファクトに分けて保存（アプリは選択中の建物種別の分だけ結合する）
+    stations = build_station_dimension(final_reachable_df)
+    rent = build_rent_fact(stats_df, stations)
+    stations_file = write_dataset(stations, "station_dimension", csv=csv)
+    rent_file = write_dataset(rent, "rent_fact", csv=csv)
+    print(f"Station dimension saved to {stations_file} ({len(stations)} stations)")
+    print(f"Rent fact saved to {rent_file} ({len(rent)} rows)")
+
+    # 従来形式の結合結果（駅×建物種別ごとに1行）
+    joined_df = stations.merge(rent, on="station_cd", how="left", validate="one_to_many")
+
+    # 出力（CSVは最終成果物として指定時のみ）
+    output_file = write_dataset(joined_df, "joined_data", csv=csv)
     print(f"Joined data saved to {output_file}")
 
 # 実行
 if __name__ == "__main__":
-    left_join_data()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", action="store_true", help="Parquetに加えてCSVも出力する")
+    args = parser.parse_args()
+    left_join_data(args.csv)
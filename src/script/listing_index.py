@@ -0,0 +1,126 @@
+import os
+import hashlib
+from datetime import date
+import pandas as pd
+from crawl_journal import columns, numeric_columns
+
+# 地域ごとの既知物件インデックス（差分クロール用）
+# 物件は 建物名 + 路線情報 + 賃料 + 管理費 のフィンガープリントで識別し、
+# 建物名 + 路線情報 が同じで金額だけ違うものは価格変更として扱う（最終ページまで取得した場合のみ）。
+# 部屋番号はないので、同じ建物で金額も同じ部屋はフィンガープリントごとの件数として持つ（重複の扱いは dedup_listings.py）
+delta_columns = ["変更種別"] + columns + ["旧賃料", "旧管理費", "旧月額"]
+
+
+def _amount(value):
+    return "" if pd.isna(value) else f"{float(value):.4f}"
+
+# 物件のフィンガープリント
+def fingerprint(row):
+    key = "\t".join([str(row["建物名"]), str(row["路線情報"]), _amount(row["賃料"]), _amount(row["管理費"])])
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+class ListingIndex:
+    def __init__(self, region_dir):
+        self.path = os.path.join(region_dir, "listing_index.csv")
+        self.delta_path = os.path.join(region_dir, "delta.csv")
+        self.listings = {}  # フィンガープリント -> 物件（件数＝同じフィンガープリントの部屋数）
+        self.stopped_early = False  # 既知物件だけのページで取得を打ち切ったか
+        if os.path.exists(self.path):
+            df = pd.read_csv(self.path, dtype={"fingerprint": str})
+            df = df.astype(object).where(df.notna(), None)
+            if "件数" not in df.columns:
+                df["件数"] = 1
+            for record in df.to_dict("records"):
+                record["件数"] = int(record["件数"] or 1)
+                self.listings[record.pop("fingerprint")] = record
+
+    def __len__(self):
+        return len(self.listings)
+
+    def __contains__(self, row):
+        return fingerprint(row) in self.listings
+
+    # ページの全物件が既知か
+    def all_known(self, rows):
+        return bool(rows) and all(row in self for row in rows)
+
+    # 取得した物件を反映し、差分（追加・削除・価格変更、1部屋1行）を返す
+    # 削除と価格変更は最終ページまで取得した場合（full_crawl）のみ判定できる。
+    # 途中で打ち切った場合、今回見なかった既知物件はまだ掲載中かもしれないので、新しい物件はすべて追加とする
+    def apply(self, rows, full_crawl, today=None):
+        today = today or date.today().isoformat()
+        seen = {}  # フィンガープリント -> (最初の行, 件数)
+        for row in rows:
+            fp = fingerprint(row)
+            first, count = seen.get(fp, (row, 0))
+            seen[fp] = (first, count + 1)
+
+        delta = []
+        added = []
+        for fp, (row, count) in seen.items():
+            if fp not in self.listings:
+                added.append((fp, row, count))
+                continue
+            record = self.listings[fp]
+            record["last_seen"] = today
+            # 打ち切った場合は同じ部屋の残りが未取得のページにあるかもしれないので件数を減らさない
+            new_count = count if full_crawl else max(count, record["件数"])
+            change = {"変更種別": "added" if new_count > record["件数"] else "removed",
+                      **{column: record[column] for column in columns}}
+            delta += [change] * abs(new_count - record["件数"])
+            record["件数"] = new_count
+
+        # 今回見つからなかった既知物件を 建物名 + 路線情報 で引けるようにする
+        unseen_by_identity = {}
+        if full_crawl:
+            for fp, record in self.listings.items():
+                if fp not in seen:
+                    unseen_by_identity.setdefault((record["建物名"], record["路線情報"]), []).append(fp)
+
+        for fp, row, count in added:
+            record = {column: row[column] for column in columns}
+            record["first_seen"] = today
+            record["last_seen"] = today
+            record["件数"] = count
+            candidates = unseen_by_identity.get((row["建物名"], row["路線情報"]))
+            if candidates:
+                # 同じ物件の金額が変わった（件数の差は追加・削除）
+                old_fp = candidates.pop()
+                old = self.listings.pop(old_fp)
+                record["first_seen"] = old["first_seen"]
+                changed = min(count, old["件数"])
+                delta += [{"変更種別": "price_changed", **row,
+                           "旧賃料": old["賃料"], "旧管理費": old["管理費"], "旧月額": old["月額"]}] * changed
+                delta += [{"変更種別": "added", **row}] * (count - changed)
+                delta += [{"変更種別": "removed", **{column: old[column] for column in columns}}] * (old["件数"] - changed)
+            else:
+                delta += [{"変更種別": "added", **row}] * count
+            self.listings[fp] = record
+
+        for fps in unseen_by_identity.values():
+            for old_fp in fps:
+                old = self.listings.pop(old_fp)
+                delta += [{"変更種別": "removed", **{column: old[column] for column in columns}}] * old["件数"]
+
+        return delta
+
+    def save(self):
+        df = pd.DataFrame(
+            [{"fingerprint": fp, **record} for fp, record in self.listings.items()],
+            columns=["fingerprint"] + columns + ["first_seen", "last_seen", "件数"],
+        )
+        df.to_csv(self.path, index=False, encoding="utf-8-sig")
+
+    # 現在掲載中の全物件（スナップショット、同じフィンガープリントの部屋は件数分の行にする）
+    def export_snapshot(self, output_file):
+        records = [record for record in self.listings.values() for _ in range(record["件数"])]
+        df = pd.DataFrame(records, columns=columns)
+        df[numeric_columns] = df[numeric_columns].astype(float)
+        df.to_csv(output_file, index=False, encoding="utf-8-sig")
+        return len(df)
+
+    def export_delta(self, delta):
+        df = pd.DataFrame(delta, columns=delta_columns)
+        df.to_csv(self.delta_path, index=False, encoding="utf-8-sig")
+        return df["変更種別"].value_counts().to_dict()
@@ -0,0 +1,163 @@
+import math
+import numpy as np
+
+# 地図の点をズームレベルごとのグリッドでまとめる（サーバー側のクラスタリング）
+# 各点のセル番号はズームレベルごとに起動時に計算しておき、表示範囲内の点だけをセル単位で集計する。
+# セルは画面上で cell_pixels 四方なので、返すクラスタ数は表示範囲の広さだけで決まり、データ件数によらない
+tile_size = 256  # Webメルカトルのタイル1枚のピクセル数
+cell_pixels = 48  # クラスタ1つが受け持つ画面上の大きさ（ピクセル）
+min_zoom = 4
+max_zoom = 16
+view_padding = 0.5  # 表示範囲の外側に余分に返す幅（表示範囲の幅・高さに対する割合）
+
+
+# 経度・緯度をWebメルカトルの0～1の座標に変換
+def mercator_xy(lon, lat):
+    x = (np.asarray(lon, dtype=float) + 180) / 360
+    lat_rad = np.radians(np.clip(np.asarray(lat, dtype=float), -85.05, 85.05))
+    y = (1 - np.log(np.tan(lat_rad) + 1 / np.cos(lat_rad)) / np.pi) / 2
+    return x, y
+
+# 地図のズーム値をクラスタのズームレベルにする
+def zoom_level(zoom):
+    return int(min(max(math.floor(zoom), min_zoom), max_zoom))
+
+# 中心・ズームと画面のピクセル数から表示範囲（余白込み）を求める
+def view_bbox(center, zoom, width_px=1600, height_px=1000, padding=view_padding):
+    degrees_per_px = 360 / (tile_size * 2 ** zoom)
+    half_lon = width_px / 2 * degrees_per_px * (1 + 2 * padding)
+    half_lat = height_px / 2 * degrees_per_px * math.cos(math.radians(center["lat"])) * (1 + 2 * padding)
+    return [center["lon"] - half_lon, center["lat"] - half_lat, center["lon"] + half_lon, center["lat"] + half_lat]
+
+# 初期表示のクラスタ条件（ズームレベルと表示範囲）
+def initial_map_view(view):
+    return {"level": zoom_level(view["zoom"]), "bbox": view_bbox(view["center"], view["zoom"])}
+
+
+class ClusterGrid:
+    def __init__(self, lon, lat):
+        self.lon = np.asarray(lon, dtype=float)
+        self.lat = np.asarray(lat, dtype=float)
+        x, y = mercator_xy(self.lon, self.lat)
+        # ズームレベルごとのセル番号（y * 列数 + x）
+        self.cells = {}
+        for level in range(min_zoom, max_zoom + 1):
+            cells_per_side = tile_size * 2 ** level // cell_pixels
+            cell_x = np.minimum((x * cells_per_side).astype(np.int64), cells_per_side - 1)
+            cell_y = np.minimum((y * cells_per_side).astype(np.int64), cells_per_side - 1)
+            self.cells[level] = cell_y * cells_per_side + cell_x
+
+    # 行位置 positions の点のうち表示範囲 bbox 内のものをセルごとにまとめる
+    # values を渡すとクラスタごとの最小値・中央値（欠損は除く）、codes を渡すと最小のコード（-1は除く）も返す
+    def clusters(self, positions, level, bbox, values=None, codes=None):
+        positions = np.asarray(positions, dtype=np.int64)
+        min_lon, min_lat, max_lon, max_lat = bbox
+        lon, lat = self.lon[positions], self.lat[positions]
+        positions = positions[(lon >= min_lon) & (lon <= max_lon) & (lat >= min_lat) & (lat <= max_lat)]
+
+        cells = self.cells[zoom_level(level)][positions]
+        sort_values = values[positions] if values is not None else np.zeros(len(positions))
+        order = np.lexsort((sort_values, cells))  # セル順、セル内は値の小さい順（欠損は最後）
+        positions, cells = positions[order], cells[order]
+
+        starts = np.flatnonzero(np.r_[True, cells[1:] != cells[:-1]]) if len(cells) else np.empty(0, dtype=np.int64)
+        counts = np.diff(np.r_[starts, len(cells)])
+        result = {"positions": positions, "starts": starts, "count": counts}
+        if len(starts) == 0:
+            result.update(lon=np.empty(0), lat=np.empty(0), min=np.empty(0), median=np.empty(0),
+                          code=np.empty(0, dtype=np.int64))
+            return result
+
+        result["lon"] = np.add.reduceat(self.lon[positions], starts) / counts
+        result["lat"] = np.add.reduceat(self.lat[positions], starts) / counts
+        if values is not None:
+            sorted_values = values[positions]
+            valid = np.add.reduceat((~np.isnan(sorted_values)).astype(np.int64), starts)
+            lower = starts + np.maximum(valid - 1, 0) // 2
+            upper = starts + np.maximum(valid, 1) // 2
+            result["min"] = np.where(valid > 0, sorted_values[starts], np.nan)
+            result["median"] = np.where(valid > 0, (sorted_values[lower] + sorted_values[upper]) / 2, np.nan)
+        if codes is not None:
+            sorted_codes = np.where(codes[positions] < 0, np.iinfo(np.int64).max, codes[positions].astype(np.int64))
+            minimum = np.minimum.reduceat(sorted_codes, starts)
+            result["code"] = np.where(minimum == np.iinfo(np.int64).max, -1, minimum)
+        return result
+
+
+# 1点だけのクラスタの行位置（個別の点として描く）
+def single_positions(clusters):
+    return clusters["positions"][clusters["starts"][clusters["count"] == 1]]
+
+# 2点以上のクラスタのトレース（ラベルごとに色分け、点の数に応じて大きくする）
+def cluster_traces(clusters, labels, color_of, marker_size=12, with_values=False):
+    multi = np.flatnonzero(clusters["count"] > 1)
+    labels = np.asarray(labels, dtype=object)[multi]
+    hovertemplate = "<b>%{customdata[0]}</b>"
+    if with_values:
+        hovertemplate += "<br>月額（最安）=%{customdata[1]}<br>月額（中央値）=%{customdata[2]}"
+    hovertemplate += "<extra></extra>"
+
+    traces = []
+    for label in dict.fromkeys(labels):
+        if label is None:
+            continue  # 色分けの値が欠損しているクラスタは描かない（個別の点と同じ）
+        selected = multi[labels == label]
+        counts = clusters["count"][selected]
+        customdata = [[f"{count}駅"] for count in counts]
+        if with_values:
+            customdata = [
+                [f"{count}駅",
+                 None if np.isnan(low) else round(float(low), 2),
+                 None if np.isnan(mid) else round(float(mid), 2)]
+                for count, low, mid in zip(counts, clusters["min"][selected], clusters["median"][selected])
+            ]
+        traces.append({
+            "type": "scattermapbox",
+            "lat": clusters["lat"][selected].round(5),
+            "lon": clusters["lon"][selected].round(5),
+            "mode": "markers+text",
+            "name": f"{label}（クラスタ）",
+            "text": counts,
+            "textfont": {"color": "black"},
+            "marker": {"size": marker_size + 4 * np.log2(counts), "color": color_of(label), "opacity": 0.85},
+            "customdata": customdata,
+            "hovertemplate": hovertemplate,
+        })
+    return traces
+
+# 表示範囲の更新（ブラウザ側）。ズームレベルが変わるか、前回サーバーに送った範囲から
+# 表示範囲がはみ出したときだけ map-view を更新し、それ以外のパン・ズームではサーバーに問い合わせない
+map_view_script = """
+function(relayoutData, mapState, mapView) {
+    const noUpdate = window.dash_clientside.no_update;
+    if (!relayoutData || !("mapbox.center" in relayoutData || "mapbox.zoom" in relayoutData)) {
+        return [noUpdate, noUpdate];
+    }
+    const state = Object.assign({}, mapState);
+    if ("mapbox.center" in relayoutData) { state.center = relayoutData["mapbox.center"]; }
+    if ("mapbox.zoom" in relayoutData) { state.zoom = relayoutData["mapbox.zoom"]; }
+
+    let bbox;
+    const derived = relayoutData["mapbox._derived"];
+    if (derived && derived.coordinates) {
+        const lons = derived.coordinates.map(c => c[0]);
+        const lats = derived.coordinates.map(c => c[1]);
+        bbox = [Math.min(...lons), Math.min(...lats), Math.max(...lons), Math.max(...lats)];
+    } else {
+        const degreesPerPx = 360 / (TILE_SIZE * Math.pow(2, state.zoom));
+        const halfLon = window.innerWidth / 2 * degreesPerPx;
+        const halfLat = window.innerHeight / 2 * degreesPerPx * Math.cos(state.center.lat * Math.PI / 180);
+        bbox = [state.center.lon - halfLon, state.center.lat - halfLat, state.center.lon + halfLon, state.center.lat + halfLat];
+    }
+
+    const level = Math.min(Math.max(Math.floor(state.zoom), MIN_ZOOM), MAX_ZOOM);
+    if (mapView && mapView.level === level && bbox[0] >= mapView.bbox[0] && bbox[1] >= mapView.bbox[1]
+            && bbox[2] <= mapView.bbox[2] && bbox[3] <= mapView.bbox[3]) {
+        return [state, noUpdate];
+    }
+    const padLon = (bbox[2] - bbox[0]) * PADDING;
+    const padLat = (bbox[3] - bbox[1]) * PADDING;
+    return [state, {level: level, bbox: [bbox[0] - padLon, bbox[1] - padLat, bbox[2] + padLon, bbox[3] + padLat]}];
+}
+""".replace("TILE_SIZE", str(tile_size)).replace("MIN_ZOOM", str(min_zoom)).replace(
+    "MAX_ZOOM", str(max_zoom)).replace("PADDING", str(view_padding))
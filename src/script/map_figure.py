@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+import plotly.express as px
+from map_clusters import single_positions, cluster_traces
+
+# 地図の図をplotly.expressを通さずに作る
+# 座標・ホバー表示・色分けのカテゴリ番号を起動時に配列にしておき、
+# 表示のたびにはカテゴリごとの scattermapbox トレースを配列の切り出しだけで作る。
+# 図はプロパティの検証を省くためdict（Dashにそのまま返せる形式）で作る
+coordinate_digits = 5  # 緯度経度の小数点以下の桁数（約1m）
+
+
+# ホバー用の値（数値はJSONで引用符が付かないよう数値のまま、欠損はNone）
+def format_hover_values(values):
+    if pd.api.types.is_integer_dtype(values.dtype):
+        return np.array([None if pd.isna(v) else int(v) for v in values], dtype=object)
+    if pd.api.types.is_numeric_dtype(values.dtype):
+        return np.where(values.isna(), None, values.to_numpy(dtype=float, na_value=np.nan)).astype(object)
+    return values.astype("string").fillna("-").to_numpy(dtype=object)
+
+
+class MapPoints:
+    # color_columns: 色分け名 -> (列名, カラーマップ)
+    def __init__(self, data, hover_name, hover_columns, color_columns):
+        self.lat = data["lat"].round(coordinate_digits).to_numpy(dtype=float)
+        self.lon = data["lon"].round(coordinate_digits).to_numpy(dtype=float)
+
+        # ホバーは値だけをcustomdataに持ち、ラベルはhovertemplateに1度だけ書く
+        self.customdata = np.column_stack(
+            [format_hover_values(data[hover_name])] + [format_hover_values(data[column]) for column in hover_columns]
+        )
+        self.hovertemplate = (
+            "<b>%{customdata[0]}</b><br><br>"
+            + "<br>".join(f"{column}=%{{customdata[{i}]}}" for i, column in enumerate(hover_columns, start=1))
+            + "<extra></extra>"
+        )
+
+        # 色分けごとのカテゴリ番号（欠損は-1）と各カテゴリの色
+        # カラーマップにないカテゴリは plotly.express と同じく既定の色を順に割り当てる
+        self.codes = {}
+        self.categories = {}
+        self.colors = {}
+        for name, (column, color_map) in color_columns.items():
+            categorical = pd.Categorical(data[column])
+            fallback = iter(px.colors.qualitative.Plotly * (len(categorical.categories) // 10 + 1))
+            self.codes[name] = categorical.codes
+            self.categories[name] = list(categorical.categories)
+            self.colors[name] = [
+                color_map[category] if category in color_map else next(fallback)
+                for category in categorical.categories
+            ]
+
+    # 行位置 positions の点を色分け color_by のカテゴリごとのトレースにする
+    def traces(self, positions, color_by, marker_size=12):
+        codes = self.codes[color_by][positions]
+        order = np.argsort(codes, kind="stable")
+        sorted_codes = codes[order]
+        boundaries = np.flatnonzero(np.diff(sorted_codes)) + 1
+        traces = []
+        for group in np.split(order, boundaries):
+            code = codes[group[0]] if len(group) else -1
+            if code < 0:
+                continue  # 色分けの値が欠損している点は描かない（plotly.expressと同じ）
+            selected = positions[group]
+            traces.append({
+                "type": "scattermapbox",
+                "lat": self.lat[selected],
+                "lon": self.lon[selected],
+                "mode": "markers",
+                "name": self.categories[color_by][code],
+                "marker": {"size": marker_size, "color": self.colors[color_by][code]},
+                "customdata": self.customdata[selected],
+                "hovertemplate": self.hovertemplate,
+            })
+        return traces
+
+    # カテゴリ番号をカテゴリ名にする（欠損の-1はNone）
+    def category_labels(self, color_by, codes):
+        categories = np.array(self.categories[color_by] + [None], dtype=object)
+        return categories[np.where(np.asarray(codes) < 0, len(categories) - 1, codes)]
+
+    # カテゴリ名の色（点にないカテゴリは灰色）
+    def category_color(self, color_by, category):
+        colors = dict(zip(self.categories[color_by], self.colors[color_by]))
+        return colors.get(category, "#888888")
+
+
+# 地図の図（map_state の中心・ズームで表示）
+def create_lean_map_figure(points, positions, color_by, map_state, uirevision, accesstoken=None):
+    return {
+        "data": points.traces(np.asarray(positions), color_by),
+        "layout": {
+            "margin": {"l": 0, "r": 0, "t": 0, "b": 0},
+            "paper_bgcolor": "black",
+            "mapbox": {
+                "style": "carto-darkmatter",
+                "accesstoken": accesstoken,
+                "center": map_state["center"],
+                "zoom": map_state["zoom"],
+            },
+            "showlegend": False,
+            "uirevision": uirevision,
+        },
+    }
+
+# ズームレベル・表示範囲ごとにまとめた地図の図（map_view の level と bbox でまとめる）
+# 1点だけのセルは通常の点、2点以上のセルは件数を書いたクラスタとして描く。
+# クラスタの色は values を渡した場合は label_clusters(clusters) の結果、渡さない場合は最も小さいカテゴリ
+def create_clustered_map_figure(points, grid, positions, color_by, map_view, map_state, uirevision,
+                                accesstoken=None, values=None, label_clusters=None):
+    clusters = grid.clusters(positions, map_view["level"], map_view["bbox"], values=values, codes=points.codes[color_by])
+    figure = create_lean_map_figure(points, single_positions(clusters), color_by, map_state, uirevision, accesstoken)
+    labels = label_clusters(clusters) if label_clusters else points.category_labels(color_by, clusters["code"])
+    figure["data"] += cluster_traces(
+        clusters, labels, lambda label: points.category_color(color_by, label), with_values=values is not None
+    )
+    return figure
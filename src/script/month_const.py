@@ -1,33 +1,106 @@
-import os
+import sys
+import argparse
+import numpy as np
 import pandas as pd
+from data_store import read_dataset, iter_dataset, write_dataset, dataset_exists, dataset_version
+from streaming_stats import aggregate_chunks, finalize, to_fixed_point, value_scale
 
 # 出力ディレクトリ
 output_dir = "./output"
 
+# 集計の入力（重複物件をまとめた物件表と、その元のマージ済みデータ。まとめ方は dedup_listings.py を参照）
+source_dataset = "canonical_listings"
+merged_dataset = "merged_data"
+
+# 集計キーと分位点
+group_keys = ["建物種別", "駅名"]
+quantiles = [("月額_p10", 0.1), ("月額_中央値", 0.5), ("月額_p90", 0.9)]
+# 平均を出す内訳の列（賃料と管理費）
+breakdown_columns = ["賃料", "管理費"]
+stats_columns = (
+    group_keys + ["件数", "月額"] + [label for label, _ in quantiles]
+    + ["月額_最小", "月額_最大"] + [f"{column}_平均" for column in breakdown_columns] + ["管理費率"]
+)
+
+# 建物種別・駅名ごとの統計（件数・平均・分位点・最小/最大・賃料と管理費の平均）
+# グループ順・月額順に1度並べ替え、グループの境界位置から全統計を配列演算で求める
+def summarize_in_memory(df):
+    df = df.dropna(subset=group_keys + ["月額"]).sort_values(group_keys + ["月額"], kind="stable")
+    if df.empty:
+        return pd.DataFrame(columns=[column for column in stats_columns if column != "管理費率"])
+    group_codes = df.groupby(group_keys, observed=True, sort=False).ngroup().to_numpy()
+    starts = np.flatnonzero(np.r_[True, group_codes[1:] != group_codes[:-1]])
+    counts = np.diff(np.r_[starts, len(df)])
+    values = df["月額"].to_numpy(dtype=float)
+
+    stats = df[group_keys].iloc[starts].reset_index(drop=True)
+    stats["件数"] = counts
+    # 平均は円単位の整数で合計する（ストリーミング集計と同じ値になる）
+    stats["月額"] = np.add.reduceat(to_fixed_point(values), starts) / value_scale / counts
+    for label, q in quantiles:
+        # 線形補間（pandasのquantileと同じ）
+        position = starts + q * (counts - 1)
+        lower = np.floor(position).astype(int)
+        upper = np.ceil(position).astype(int)
+        stats[label] = values[lower] + (values[upper] - values[lower]) * (position - lower)
+    stats["月額_最小"] = values[starts]
+    stats["月額_最大"] = values[starts + counts - 1]
+    for column in breakdown_columns:
+        stats[f"{column}_平均"] = np.add.reduceat(to_fixed_point(df[column]), starts) / value_scale / counts
+    return stats
+
+# ストリーミング集計（チャンクごとの部分集計をマージ、分位点はスケッチによる近似値）
+def summarize_streaming(source, chunksize, workers):
+    chunks = iter_dataset(source, columns=group_keys + ["月額"] + breakdown_columns, chunksize=chunksize)
+    total = aggregate_chunks(chunks, group_keys, "月額", workers, breakdown_columns)
+    return finalize(total, group_keys, "月額", quantiles, breakdown_columns)
+
+# 重複をまとめた物件表がマージ済みデータより古い（またはない）か
+# （pipeline.py を通さずに rent_scraper の後で直接実行した場合、前回の物件表が残っている）
+def canonical_is_stale():
+    if not dataset_exists(source_dataset):
+        return True
+    if not dataset_exists(merged_dataset):
+        return False
+    return dataset_version(source_dataset)[2] < dataset_version(merged_dataset)[2]
+
 # 平均月額計算関数
-def calculate_average_monthly_cost():
-    # マージ済みデータのファイルパス
-    merged_file_path = os.path.join(output_dir, "merged_data.csv")
-    
+def calculate_average_monthly_cost(csv=False, streaming=False, chunksize=100000, workers=1):
     # ファイルが存在するかチェック
-    if not os.path.exists(merged_file_path):
+    if not dataset_exists(merged_dataset) and not dataset_exists(source_dataset):
         print("Merged data file not found!")
         return
+    if canonical_is_stale():
+        # 前回の物件表を集計しないよう止める（重複の判定は全件を読み込むので、ここでは作り直さない）
+        sys.exit(f"{source_dataset} is missing or older than {merged_dataset}. "
+                 "Run src/script/dedup_listings.py first.")
 
-    # マージ済みデータを読み込む
-    df = pd.read_csv(merged_file_path)
+    if streaming:
+        stats = summarize_streaming(source_dataset, chunksize, workers)
+    else:
+        # 物件データを読み込む（集計に使う列のみ）
+        df = read_dataset(source_dataset, columns=group_keys + ["月額"] + breakdown_columns)
+        stats = summarize_in_memory(df)
 
-    # 月額の平均値を計算 (建物種別と駅名でグループ化)
-    grouped = df.groupby(["建物種別", "駅名"], as_index=False)["月額"].mean()
+    # 月額に占める管理費の割合
+    stats["管理費率"] = (stats["管理費_平均"] / stats["月額"]).round(3)
 
     # 四捨五入して少数第2位まで
-    grouped["月額"] = grouped["月額"].round(2)
+    value_columns = [column for column in stats_columns if column not in group_keys + ["件数", "管理費率"]]
+    stats[value_columns] = stats[value_columns].round(2)
 
-    # 平均月額データを保存する
-    output_file = os.path.join(output_dir, "average_monthly_cost_by_building_and_station.csv")
-    grouped.to_csv(output_file, index=False, encoding="utf-8-sig")
+    # 統計表と平均月額データを保存する
+    stats_file = write_dataset(stats[stats_columns], "monthly_cost_stats", csv=csv)
+    print(f"Saved monthly cost stats to {stats_file}")
+    output_file = write_dataset(stats[group_keys + ["月額"]], "average_monthly_cost", csv=csv)
     print(f"Saved average monthly cost data to {output_file}")
 
 # 平均月額計算関数を実行
 if __name__ == "__main__":
-    calculate_average_monthly_cost()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", action="store_true", help="Parquetに加えてCSVも出力する")
+    parser.add_argument("--streaming", action="store_true", help="入力をチャンクごとに読み込んで集計する")
+    parser.add_argument("--chunksize", type=int, default=100000, help="ストリーミング集計で1度に読み込む行数")
+    parser.add_argument("--workers", type=int, default=1, help="ストリーミング集計のプロセス数")
+    args = parser.parse_args()
+    calculate_average_monthly_cost(args.csv, args.streaming, args.chunksize, args.workers)
@@ -0,0 +1,72 @@
+import pandas as pd
+from lxml import etree, html
+
+# NAVITIMEの到達駅一覧ページ（静的HTML）を1パスで解析する
+
+# classを含む要素のXPath条件
+def _cls(name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+# セレクタは読み込み時に一度だけコンパイル
+route_items_xpath = etree.XPath("//*[@id='text-area']/ul/li")
+route_name_xpath = etree.XPath(".//h2")
+station_items_xpath = etree.XPath(f".//ul/li/div[{_cls('station-info-area')}]")
+station_name_xpath = etree.XPath(f".//div[{_cls('station-name')}]")
+transit_time_xpath = etree.XPath(f".//div[{_cls('station-note')}]/span[{_cls('time')}]")
+transfer_count_xpath = etree.XPath(f".//div[{_cls('station-note')}]/span[{_cls('transit-count')}]")
+
+# 要素の表示テキスト（見つからなければ空文字）
+def _text(elements):
+    return " ".join(elements[0].text_content().split()) if elements else ""
+
+# 到達駅一覧を [駅名, 所要時間範囲, 所要時間, 乗り換え回数, 路線名] の行に変換
+def parse_reachable_html(page_html, time_range_label):
+    tree = html.fromstring(page_html)
+
+    data = []
+    for item in route_items_xpath(tree):
+        # 路線名の取得
+        route_name = _text(route_name_xpath(item))
+
+        # 駅情報を取得
+        for station in station_items_xpath(item):
+            data.append([
+                _text(station_name_xpath(station)),
+                time_range_label,
+                _text(transit_time_xpath(station)),
+                _text(transfer_count_xpath(station)),
+                route_name,
+            ])
+    return data
+
+# 「4分」「1時間5分」などの所要時間を分に変換（Series単位、解析できなければ欠損）
+def minutes_series(texts):
+    texts = texts.astype("string")
+    hours = texts.str.extract(r"(\d+)時間", expand=False).astype("Float64").fillna(0)
+    minutes = texts.str.extract(r"(\d+)分", expand=False).astype("Float64")
+    has_time = texts.str.contains(r"\d+(?:時間|分)", regex=True).fillna(False)
+    return (hours * 60 + minutes.fillna(0)).where(has_time).astype("Int16")
+
+# 「乗換1回」を回数に変換（Series単位）
+def transfers_series(texts):
+    return texts.astype("string").str.extract(r"乗換(\d+)回", expand=False).astype("Int8")
+
+# 「11-20分」から時間範囲の上限（分）を取り出す（Series単位）
+def range_upper_series(labels):
+    return labels.astype("string").str.extract(r"-(\d+)分", expand=False).astype("Int16")
+
+# 「11-20分」から時間範囲の下限（分）を取り出す（Series単位）
+def range_lower_series(labels):
+    return labels.astype("string").str.extract(r"(\d+)-", expand=False).astype("Int16")
+
+# 所要時間・乗り換え回数の数値列（所要分・乗換回数）と、所要分を時間範囲の上限で代用した行のマスク
+# 所要分が読めないか所要時間範囲に収まらない行は範囲の上限を使う（列がずれて所要時間に「乗換0回」が入った行など）
+# 乗り換え回数が読めない行は所要時間の列の「乗換N回」を使う
+def commute_columns(df):
+    lower = range_lower_series(df["所要時間範囲"])
+    upper = range_upper_series(df["所要時間範囲"])
+    minutes = minutes_series(df["所要時間"])
+    valid = (minutes.notna() & (minutes >= lower) & (minutes <= upper)).fillna(False).astype(bool)
+    transfers = transfers_series(df["乗り換え回数"]).fillna(transfers_series(df["所要時間"]))
+    commute = pd.DataFrame({"所要分": minutes.where(valid, upper).astype("Int16"), "乗換回数": transfers}, index=df.index)
+    return commute, ~valid
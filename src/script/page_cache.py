@@ -0,0 +1,107 @@
+import os
+import glob
+import gzip
+import time
+import hashlib
+import threading
+
+# 取得済みページのディスクキャッシュ
+# ファイル名は「URLのハッシュ_取得時刻.html.gz」。読み込み時にmtimeを更新し、LRUの順序に使う
+# ttl は取得からの有効期限（秒）。0ならキャッシュは保存するだけで通常の取得には使わない（--replay 用）
+class PageCache:
+    def __init__(self, cache_dir="./output/cache/pages", ttl=12 * 60 * 60, max_bytes=2 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.ttl = ttl  # 秒（Noneなら期限なし）
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self.total_bytes = sum(os.path.getsize(path) for path in self._all_entries())
+
+    def _all_entries(self):
+        return glob.glob(os.path.join(self.cache_dir, "*", "*.html.gz"))
+
+    def _key(self, url):
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    # URLに対応するエントリ（新しい順）
+    def _entries(self, url):
+        key = self._key(url)
+        paths = glob.glob(os.path.join(self.cache_dir, key[:2], f"{key}_*.html.gz"))
+        return sorted(paths, key=lambda path: int(path.rsplit("_", 1)[1].split(".")[0]), reverse=True)
+
+    # キャッシュ済みのHTMLを返す（なければNone、allow_staleならTTL切れも返す）
+    def get(self, url, allow_stale=False):
+        content = self._read(url, allow_stale)
+        with self.lock:
+            if content is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return content
+
+    def _read(self, url, allow_stale):
+        entries = self._entries(url)
+        if not entries:
+            return None
+
+        path = entries[0]
+        fetched_at = int(path.rsplit("_", 1)[1].split(".")[0])
+        if not allow_stale and self.ttl is not None and time.time() - fetched_at >= self.ttl:
+            return None
+
+        # 読み込み中に他のスレッドが置き換え・削除した場合はキャッシュなしとして扱う
+        try:
+            with gzip.open(path, "rb") as f:
+                content = f.read()
+            os.utime(path)  # LRU用にアクセス時刻を更新
+        except (OSError, EOFError):
+            return None
+        return content
+
+    # キャッシュの利用実績
+    def summary(self):
+        return f"[page cache] {self.hits} hits, {self.misses} misses (ttl {self.ttl}s)"
+
+    # HTMLを保存（同じURLの古いエントリは削除）
+    def put(self, url, content):
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+
+        key = self._key(url)
+        entry_dir = os.path.join(self.cache_dir, key[:2])
+        os.makedirs(entry_dir, exist_ok=True)
+        path = os.path.join(entry_dir, f"{key}_{int(time.time())}.html.gz")
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, "wb", compresslevel=6) as f:
+            f.write(content)
+
+        with self.lock:
+            for old_path in self._entries(url):
+                self._remove(old_path)
+            os.replace(tmp_path, path)
+            self.total_bytes += os.path.getsize(path)
+            if self.max_bytes is not None and self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _remove(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            self.total_bytes -= size
+        except FileNotFoundError:
+            pass
+
+    # 最後に使われた時刻の古い順に削除し、上限の9割まで減らす
+    def _evict(self):
+        entries = []
+        for path in self._all_entries():
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except FileNotFoundError:
+                pass  # 一覧を取った後に削除されたエントリ
+        for _, path in sorted(entries):
+            if self.total_bytes <= self.max_bytes * 0.9:
+                break
+            self._remove(path)
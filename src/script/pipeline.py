@@ -0,0 +1,217 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# バッチスクリプトの依存関係を考慮したパイプライン実行
+# 各ステージの入力ファイルとスクリプトのハッシュが前回と同じで、出力も変更されていなければスキップする。
+# 依存関係のないステージ（家賃系と駅系）は並列に実行する
+script_dir = os.path.dirname(os.path.abspath(__file__))
+state_file = "./output/.pipeline_state.json"
+
+# ステージ定義（code: ハッシュ対象のスクリプト、inputs/outputs: データファイル）
+# スクレイピングのステージは入力ファイルがなくハッシュでは変化を検出できないので、max_age（秒）で鮮度を決める。
+# 前回の成功から max_age が経っていれば再実行する（--replay のときはキャッシュの再解析なので適用しない）
+scrape_max_age = 24 * 60 * 60
+stages = {
+    "reachable_stations": {
+        "script": "reachable_station_scraper.py",
+        "code": ["reachable_station_scraper.py", "navitime_parser.py", "page_cache.py", "rate_limiter.py",
+                 "reachability_matrix.py", "data_store.py"],
+        "inputs": [],
+        "outputs": ["./output/reachable_stations.parquet"],
+        "replay": True,
+        "max_age": scrape_max_age,
+    },
+    "filter_stations": {
+        "script": "filter_station_data.py",
+        "code": ["filter_station_data.py", "station_index.py", "station_spatial_index.py", "navitime_parser.py",
+                 "data_store.py"],
+        "inputs": ["./output/reachable_stations.parquet", "./src/data/station20240426free.csv"],
+        "outputs": ["./output/final_reachable_stations.parquet", "./output/unmatched_stations.csv"],
+    },
+    "rent": {
+        "script": "rent_scraper.py",
+        "code": ["rent_scraper.py", "suumo_parser.py", "crawl_scheduler.py", "page_cache.py", "crawl_journal.py",
+                 "listing_index.py", "rate_limiter.py", "snapshot_store.py", "data_store.py"],
+        "inputs": [],
+        "outputs": ["./output/merged_data.parquet"],
+        "replay": True,
+        "max_age": scrape_max_age,
+    },
+    "dedup": {
+        "script": "dedup_listings.py",
+        "code": ["dedup_listings.py", "data_store.py"],
+        "inputs": ["./output/merged_data.parquet"],
+        "outputs": ["./output/canonical_listings.parquet"],
+    },
+    "month": {
+        "script": "month_const.py",
+        "code": ["month_const.py", "streaming_stats.py", "data_store.py"],
+        "inputs": ["./output/canonical_listings.parquet"],
+        "outputs": ["./output/monthly_cost_stats_by_building_and_station.parquet",
+                    "./output/average_monthly_cost_by_building_and_station.parquet"],
+    },
+    "join": {
+        "script": "join_const.py",
+        "code": ["join_const.py", "cost_category.py", "navitime_parser.py", "data_store.py"],
+        "inputs": ["./output/monthly_cost_stats_by_building_and_station.parquet",
+                   "./output/final_reachable_stations.parquet"],
+        "outputs": ["./output/station_dimension.parquet", "./output/rent_fact.parquet", "./output/joined_data.parquet"],
+    },
+}
+
+
+# ファイル内容のハッシュ（存在しなければNone）
+def file_hash(path):
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# ステージの入力（データ＋スクリプト）全体のハッシュ
+def input_hash(stage):
+    digest = hashlib.sha256()
+    for path in stage["inputs"] + [os.path.join(script_dir, name) for name in stage["code"]]:
+        digest.update(f"{os.path.basename(path)}:{file_hash(path)}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+# ステージ間の依存関係（入力を出力に持つステージ）
+def dependencies(name):
+    return {
+        other for other, stage in stages.items()
+        if other != name and set(stage["outputs"]) & set(stages[name]["inputs"])
+    }
+
+# 対象ステージとその上流ステージ
+def with_upstream(targets):
+    selected = set()
+    pending = list(targets)
+    while pending:
+        name = pending.pop()
+        if name not in selected:
+            selected.add(name)
+            pending.extend(dependencies(name))
+    return selected
+
+def load_state():
+    if not os.path.exists(state_file):
+        return {}
+    with open(state_file, encoding="utf-8") as f:
+        return json.load(f)
+
+def save_state(state):
+    os.makedirs(os.path.dirname(state_file), exist_ok=True)
+    tmp_path = f"{state_file}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, state_file)
+
+# 前回から入力も出力も変わっておらず、スクレイピングのステージは max_age 以内に実行済みか
+def is_up_to_date(name, state, replay=False):
+    previous = state.get(name)
+    if not previous or previous["input_hash"] != input_hash(stages[name]):
+        return False
+    max_age = stages[name].get("max_age")
+    if max_age is not None and not replay and time.time() - previous.get("finished_at", 0) > max_age:
+        return False
+    return all(file_hash(path) == previous["outputs"].get(path) for path in stages[name]["outputs"])
+
+# ステージのスクリプトを実行
+def run_stage(name, replay=False):
+    stage = stages[name]
+    command = [sys.executable, os.path.join(script_dir, stage["script"])]
+    if replay and stage.get("replay"):
+        command.append("--replay")
+    start = time.perf_counter()
+    result = subprocess.run(command, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        print(result.stdout, end="")
+        print(result.stderr, end="", file=sys.stderr)
+    return result.returncode == 0, elapsed
+
+# パイプライン実行
+def run_pipeline(targets=None, force=(), replay=False, jobs=2, dry_run=False):
+    selected = with_upstream(targets or stages)
+    state = load_state()
+    done = set()
+    failed = set()
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        while True:
+            # 上流がすべて終わったステージを開始（スキップで進んだ分も続けて判定する）
+            progressed = True
+            while progressed:
+                progressed = False
+                for name in sorted(selected - done - failed - set(running.values())):
+                    deps = dependencies(name) & selected
+                    if deps & failed:
+                        print(f"[{name}] skipped (upstream failed)")
+                        failed.add(name)
+                        progressed = True
+                        continue
+                    if not deps <= done:
+                        continue
+
+                    if name not in force and is_up_to_date(name, state, replay):
+                        print(f"[{name}] up to date")
+                        done.add(name)
+                        progressed = True
+                        continue
+                    if dry_run:
+                        print(f"[{name}] would run")
+                        done.add(name)
+                        progressed = True
+                        continue
+
+                    print(f"[{name}] running {stages[name]['script']}")
+                    running[executor.submit(run_stage, name, replay)] = name
+
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                ok, elapsed = future.result()
+                if ok:
+                    state[name] = {
+                        "input_hash": input_hash(stages[name]),
+                        "outputs": {path: file_hash(path) for path in stages[name]["outputs"]},
+                        "finished_at": time.time(),
+                    }
+                    save_state(state)
+                    done.add(name)
+                    print(f"[{name}] done in {elapsed:.1f}s")
+                else:
+                    failed.add(name)
+                    print(f"[{name}] failed after {elapsed:.1f}s")
+
+    return not failed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("targets", nargs="*", help=f"実行するステージ（上流も含む、省略時は全ステージ）: {', '.join(stages)}")
+    parser.add_argument("--force", nargs="+", default=[], choices=list(stages), help="変更がなくても実行するステージ")
+    parser.add_argument("--replay", action="store_true", help="スクレイピングはキャッシュ済みページのみから再解析する")
+    parser.add_argument("--jobs", type=int, default=2, help="並列に実行するステージ数")
+    parser.add_argument("--dry-run", action="store_true", help="実行せずに実行予定のステージを表示する")
+    args = parser.parse_args()
+    unknown = set(args.targets) - set(stages)
+    if unknown:
+        parser.error(f"unknown stage: {', '.join(sorted(unknown))}")
+
+    ok = run_pipeline(args.targets, set(args.force), args.replay, args.jobs, args.dry_run)
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+import time
+import heapq
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from station_spatial_index import distance_km
+from station_index import normalize_station_names
+from navitime_parser import minutes_series, transfers_series
+from reachability_matrix import write_matrix
+from data_store import read_dataset, write_dataset
+
+# 駅データ（station20240426free.csv）から作る鉄道グラフと到達駅の探索（NAVITIMEにアクセスしない）
+# ノードは路線ごとの駅（station_cd）。同じ路線で e_sort が隣り合う駅を乗車の辺、
+# 同じ駅グループ（station_g_cd）の別路線の駅を乗り換えの辺で結び、隣接リストはCSR形式の配列で持つ。
+# 駅データには所要時間がないため、乗車の分数は駅間の直線距離から表定速度と停車時間で見積もる
+station_data_file = "./src/data/station20240426free.csv"
+matrix_path = "./output/rail_reachability_matrix.parquet"
+
+# 分数の係数は高輪ゲートウェイ発のスクレイピング結果との誤差が小さくなるよう合わせた値（--check で確認できる）
+speed_kmh = 50.0  # 表定速度（km/h）
+stop_minutes = 0.8  # 1駅あたりの停車時間（分）
+transfer_minutes = 7.0  # 乗り換え1回の移動・待ち時間（分）
+loop_close_km = 3.0  # 始点と終点がこの距離以内の路線は環状線として閉じる
+loop_min_stations = 8
+
+# reachable_station_scraper と同じ時間範囲と乗り換え回数の上限
+time_ranges = [(0, 10), (11, 20), (21, 30), (31, 40), (41, 50), (51, 60)]
+transit_limit = 3
+
+# 探索元の既定（reachable_station_scraper の node と同じ駅）
+default_origin = "高輪ゲートウェイ"
+
+
+# 運用中の駅を路線・路線内の順に読み込む（路線名の一覧があれば line_cd を路線名にする）
+def read_rail_stations(path=station_data_file, lines_path=None):
+    stations = pd.read_csv(
+        path, usecols=["station_cd", "station_g_cd", "station_name", "line_cd", "lon", "lat", "e_status", "e_sort"]
+    )
+    stations = stations[stations["e_status"] == 0].drop(columns=["e_status"])
+    stations = stations.sort_values(["line_cd", "e_sort"]).reset_index(drop=True)
+    if lines_path:
+        lines = pd.read_csv(lines_path, usecols=["line_cd", "line_name"])
+        stations["line_name"] = stations["line_cd"].map(lines.set_index("line_cd")["line_name"])
+        stations["line_name"] = stations["line_name"].fillna(stations["line_cd"].astype(str))
+    else:
+        stations["line_name"] = stations["line_cd"].astype(str)
+    return stations
+
+
+class RailGraph:
+    def __init__(self, stations):
+        self.station_cd = stations["station_cd"].to_numpy()
+        self.station_g_cd = stations["station_g_cd"].to_numpy()
+        self.line_cd = stations["line_cd"].to_numpy()
+        self.station_name = stations["station_name"].to_numpy(dtype=object)
+        self.line_name = stations["line_name"].to_numpy(dtype=object)
+        lon = stations["lon"].to_numpy(dtype=float)
+        lat = stations["lat"].to_numpy(dtype=float)
+        n = len(stations)
+
+        # 乗車の辺（同じ路線の隣の駅、両方向）
+        a = np.flatnonzero(self.line_cd[1:] == self.line_cd[:-1])
+        b = a + 1
+        # 環状線（始点と終点が近い路線）は終点から始点へも結ぶ
+        starts = np.flatnonzero(np.r_[True, self.line_cd[1:] != self.line_cd[:-1]])
+        ends = np.r_[starts[1:], n] - 1
+        loop = (ends - starts + 1 >= loop_min_stations) & (
+            distance_km(lon[starts], lat[starts], lon[ends], lat[ends]) <= loop_close_km
+        )
+        a = np.r_[a, ends[loop]]
+        b = np.r_[b, starts[loop]]
+        ride_minutes = stop_minutes + distance_km(lon[a], lat[a], lon[b], lat[b]) / speed_kmh * 60
+
+        # 乗り換えの辺（同じ駅グループの別路線の駅、両方向）
+        group = pd.DataFrame({"g": self.station_g_cd, "line": self.line_cd, "node": np.arange(n)})
+        pairs = group.merge(group, on="g")
+        pairs = pairs[pairs["line_x"] != pairs["line_y"]]
+
+        src = np.r_[a, b, pairs["node_x"].to_numpy()]
+        dst = np.r_[b, a, pairs["node_y"].to_numpy()]
+        minutes = np.r_[ride_minutes, ride_minutes, np.full(len(pairs), transfer_minutes)]
+        transfer = np.r_[np.zeros(2 * len(a), dtype=np.int8), np.ones(len(pairs), dtype=np.int8)]
+
+        # CSR（ノードごとの辺の開始位置 indptr と、辺の行き先・分数・乗り換えかどうか）
+        order = np.argsort(src, kind="stable")
+        self.indptr = np.r_[0, np.cumsum(np.bincount(src, minlength=n))].astype(np.int32)
+        self.indices = dst[order].astype(np.int32)
+        self.minutes = minutes[order].astype(np.float32)
+        self.transfer = transfer[order]
+        # 探索ではPythonのリストの方が要素アクセスが速いので一度だけ変換しておく
+        self._adjacency = (self.indptr.tolist(), self.indices.tolist(), self.minutes.tolist(), self.transfer.tolist())
+
+    def __len__(self):
+        return len(self.station_cd)
+
+    # 駅名または station_cd / station_g_cd から駅グループのノードを探す
+    # 同じ駅名の駅グループが複数ある（府中など）場合は決められないので、station_g_cd の指定を求める
+    def origin_nodes(self, origin):
+        if isinstance(origin, str) and not origin.isdigit():
+            matches = np.flatnonzero(self.station_name == origin)
+        else:
+            code = int(origin)
+            matches = np.flatnonzero((self.station_cd == code) | (self.station_g_cd == code))
+        if len(matches) == 0:
+            raise ValueError(f"駅が見つかりません: {origin}")
+        groups = pd.unique(self.station_g_cd[matches])
+        if len(groups) > 1:
+            candidates = ", ".join(
+                f"{group}（line_cd {'/'.join(map(str, self.line_cd[self.station_g_cd == group]))}）" for group in groups
+            )
+            raise ValueError(f"駅名が複数の駅グループに当たります: {origin}。station_g_cd で指定してください: {candidates}")
+        return np.flatnonzero(self.station_g_cd == groups[0])
+
+    # 所要時間と乗り換え回数の多基準ダイクストラ（ラベルは (ノード, 乗り換え回数) ごとの最短分）
+    # ある乗り換え回数のラベルは、それ以下の乗り換え回数でより早く着くラベルがあれば捨てる（パレート最適のみ残す）
+    def search(self, origin_nodes, max_minutes=60, max_transfers=transit_limit):
+        indptr, indices, minutes, transfer = self._adjacency
+        inf = float("inf")
+        best = [[inf] * len(self) for _ in range(max_transfers + 1)]
+        heap = []
+        for node in origin_nodes:
+            best[0][node] = 0.0
+            heap.append((0.0, 0, node))
+        heapq.heapify(heap)
+
+        while heap:
+            elapsed, transfers, node = heapq.heappop(heap)
+            if elapsed > best[transfers][node]:
+                continue
+            for edge in range(indptr[node], indptr[node + 1]):
+                next_transfers = transfers + transfer[edge]
+                if next_transfers > max_transfers:
+                    continue
+                arrival = elapsed + minutes[edge]
+                if arrival > max_minutes:
+                    continue
+                target = indices[edge]
+                # 乗り換え回数が同じか少ないラベルで同じか早く着いていれば支配される
+                if any(best[k][target] <= arrival for k in range(next_transfers + 1)):
+                    continue
+                best[next_transfers][target] = arrival
+                heapq.heappush(heap, (arrival, next_transfers, target))
+        return np.array(best)
+
+    # 到達駅の表（reachable_stations と同じ列。駅グループごとに最短の経路、同じ分数なら乗り換えの少ない経路）
+    def reachable_table(self, origin, max_minutes=60, max_transfers=transit_limit):
+        origin_nodes = self.origin_nodes(origin)
+        best = self.search(origin_nodes, max_minutes, max_transfers)
+        rounded = np.round(best)
+        transfers = np.argmin(rounded, axis=0)  # 同じ分数なら乗り換え回数の少ない方（argminは最初の位置）
+        minutes = rounded[transfers, np.arange(len(self))]
+
+        reached = np.isfinite(minutes)
+        reached[origin_nodes] = False
+        nodes = np.flatnonzero(reached)
+        table = pd.DataFrame({
+            "g": self.station_g_cd[nodes],
+            "node": nodes,
+            "分": minutes[nodes].astype(int),
+            "乗換": transfers[nodes],
+        })
+        table = table.sort_values(["g", "分", "乗換"], kind="stable").drop_duplicates("g")
+        table = table.sort_values(["分", "乗換", "node"], kind="stable")
+
+        labels = pd.cut(
+            table["分"], bins=[lower - 1 for lower, _ in time_ranges] + [time_ranges[-1][1]],
+            labels=[f"{lower}-{higher}分" for lower, higher in time_ranges],
+        )
+        return pd.DataFrame({
+            "駅名": self.station_name[table["node"]],
+            "所要時間範囲": labels.astype(str).to_numpy(),
+            "所要時間": [f"{m}分" for m in table["分"]],
+            "乗り換え回数": [f"乗換{k}回" for k in table["乗換"]],
+            "路線名": self.line_name[table["node"]],
+        }).reset_index(drop=True)
+
+
+# スクレイピング結果との比較（駅名を正規化して突合し、所要時間・時間範囲・乗り換え回数の一致を集計）
+def compare_with_scraped(table, scraped):
+    scraped = scraped.assign(
+        key=normalize_station_names(scraped["駅名"]).to_numpy(),
+        分=minutes_series(scraped["所要時間"]).to_numpy(),
+        乗換=transfers_series(scraped["乗り換え回数"]).to_numpy(),
+    )
+    graph = table.assign(
+        key=normalize_station_names(table["駅名"]).to_numpy(),
+        分=minutes_series(table["所要時間"]).to_numpy(),
+        乗換=transfers_series(table["乗り換え回数"]).to_numpy(),
+    ).drop_duplicates("key")
+    matched = scraped.merge(graph, on="key", suffixes=("_scraped", "_graph"))
+    error = (matched["分_graph"] - matched["分_scraped"]).astype(float)
+    return {
+        "scraped": len(scraped),
+        "graph": len(table),
+        "matched": len(matched),
+        "minutes_mae": float(error.abs().mean()),
+        "minutes_bias": float(error.mean()),
+        "within_5min": float((error.abs() <= 5).mean()),
+        "same_range": float((matched["所要時間範囲_scraped"].astype(str) == matched["所要時間範囲_graph"]).mean()),
+        "same_transfers": float((matched["乗換_scraped"] == matched["乗換_graph"]).mean()),
+    }
+
+
+# 全出発駅の一括探索（ワーカーごとにグラフを1度だけ作る）
+_worker_graph = None
+
+def _init_worker(path, lines_path):
+    global _worker_graph
+    _worker_graph = RailGraph(read_rail_stations(path, lines_path))
+
+def _reachable_rows(origin):
+    table = _worker_graph.reachable_table(origin)
+    return [[str(origin), *row] for row in table.itertuples(index=False, name=None)]
+
+# origins（station_g_cd）ごとの到達駅を (出発駅, 駅名, 所要時間範囲, 所要時間, 乗り換え回数, 路線名) の行で返す
+def reachable_from_origins(origins, workers=4, path=station_data_file, lines_path=None):
+    data = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(path, lines_path)) as executor:
+        for rows in executor.map(_reachable_rows, origins, chunksize=64):
+            data.extend(rows)
+    return data
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--origin", default=default_origin, help="出発駅（駅名または station_cd / station_g_cd）")
+    parser.add_argument("--lines", help="路線名の一覧（line_cd, line_name 列のCSV）。省略時は路線名に line_cd を入れる")
+    parser.add_argument("--all-origins", action="store_true", help="全駅グループを出発駅とした到達駅マトリクスを作る")
+    parser.add_argument("--workers", type=int, default=4, help="全出発駅の探索の並列プロセス数")
+    parser.add_argument("--check", action="store_true", help="スクレイピング結果（reachable_stations）と比較する")
+    parser.add_argument("--csv", action="store_true", help="Parquetに加えてCSVも出力する")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    graph = RailGraph(read_rail_stations(station_data_file, args.lines))
+    print(f"鉄道グラフ: {len(graph)}ノード, {len(graph.indices)}辺 ({(time.perf_counter() - start) * 1000:.0f}ms)")
+
+    if args.all_origins:
+        start = time.perf_counter()
+        origins = pd.unique(graph.station_g_cd)
+        data = reachable_from_origins(origins, args.workers, station_data_file, args.lines)
+        row_count = write_matrix(data, matrix_path)
+        print(f"到達駅マトリクスを保存しました（{len(origins)}出発駅, {row_count}行, "
+              f"{time.perf_counter() - start:.1f}秒）: {matrix_path}")
+        return
+
+    # 見つからない・複数の駅グループに当たる出発駅は、トレースバックではなく使い方のエラーにする
+    try:
+        graph.origin_nodes(args.origin)
+    except ValueError as e:
+        parser.error(str(e))
+
+    start = time.perf_counter()
+    table = graph.reachable_table(args.origin)
+    print(f"{args.origin}: {len(table)}駅 ({(time.perf_counter() - start) * 1000:.1f}ms)")
+    output_file = write_dataset(table, "rail_reachable_stations", csv=args.csv)
+    print(f"到達駅を保存しました: {output_file}")
+
+    if args.check:
+        result = compare_with_scraped(table, read_dataset("reachable_stations"))
+        print(f"スクレイピング結果 {result['scraped']}駅 / グラフ {result['graph']}駅 / 一致 {result['matched']}駅")
+        print(f"所要時間の誤差: 平均絶対 {result['minutes_mae']:.1f}分, 平均 {result['minutes_bias']:+.1f}分, "
+              f"5分以内 {result['within_5min']:.0%}")
+        print(f"時間範囲の一致 {result['same_range']:.0%}, 乗り換え回数の一致 {result['same_transfers']:.0%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import time
+import random
+import threading
+
+# 両スクレイパー共通のアクセス間隔制御
+# トークンバケットで送信間隔を揃え、応答時間とエラーでレートを増減（AIMD）させる。
+# 失敗したリクエストはジッター付き指数バックオフで再試行する
+
+# 再試行しないHTTPステータス（ページが存在しない等）
+non_retryable_statuses = {400, 401, 403, 404, 410}
+# レートを下げるHTTPステータス（混雑・制限）
+throttle_statuses = {429, 500, 502, 503, 504}
+
+
+# 例外からHTTPステータスを取り出す（requestsのHTTPError等）
+def status_of(error):
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None)
+
+
+class AdaptiveRateLimiter:
+    def __init__(self, name, rate=1.0, min_rate=0.1, max_rate=10.0, burst=1,
+                 increase=0.05, decrease=0.5, target_latency=3.0, log_interval=30):
+        self.name = name
+        self.rate = rate  # 秒あたりのリクエスト数
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.increase = increase  # 成功時に加算するレート
+        self.decrease = decrease  # 失敗・遅延時に掛けるレート
+        self.target_latency = target_latency
+        self.log_interval = log_interval
+
+        self.lock = threading.Lock()
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.started = self.updated
+        self.requests = 0
+        self.errors = 0
+        self.window_start = self.updated
+        self.window_requests = 0
+
+    # 送信枠を1つ取得（空くまで待つ）
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # 枠が足りなければ先に予約し、その分だけ待つ
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+    # 応答結果からレートを調整
+    def record(self, latency, status=None, error=False):
+        with self.lock:
+            self.requests += 1
+            self.window_requests += 1
+            if error or status in throttle_statuses or latency > self.target_latency:
+                self.errors += int(error or status in throttle_statuses)
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+            else:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+
+            now = time.monotonic()
+            if now - self.window_start >= self.log_interval:
+                achieved = self.window_requests / (now - self.window_start)
+                print(f"[{self.name}] {achieved:.2f} req/s achieved (limit {self.rate:.2f} req/s, errors {self.errors})")
+                self.window_start = now
+                self.window_requests = 0
+
+    # レート制御と再試行付きで呼び出す
+    def call(self, fn, *args, retries=3, base_delay=1.0, max_delay=60.0, **kwargs):
+        attempt = 0
+        while True:
+            self.acquire()
+            start = time.monotonic()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                status = status_of(e)
+                self.record(time.monotonic() - start, status, error=True)
+                if status in non_retryable_statuses or attempt >= retries:
+                    raise
+                delay = min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.5)
+                print(f"[{self.name}] retry {attempt + 1}/{retries} in {delay:.1f}s: {e}")
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.record(time.monotonic() - start)
+            return result
+
+    # 全体の実績
+    def summary(self):
+        elapsed = time.monotonic() - self.started
+        achieved = self.requests / elapsed if elapsed > 0 else 0
+        return f"[{self.name}] {self.requests} requests, {achieved:.2f} req/s achieved, final limit {self.rate:.2f} req/s, errors {self.errors}"
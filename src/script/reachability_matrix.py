@@ -0,0 +1,56 @@
+import argparse
+import pandas as pd
+from navitime_parser import commute_columns, range_upper_series
+
+# 出発駅 × 駅 × 時間範囲 × 乗り換え回数 の到達駅マトリクス（縦持ち、Parquet）
+matrix_path = "./output/reachability_matrix.parquet"
+scraped_columns = ["origin", "駅名", "所要時間範囲", "所要時間", "乗り換え回数", "路線名"]
+category_columns = ["origin", "駅名", "路線名", "所要時間範囲"]
+
+# スクレイピング結果を型付きのマトリクスに変換
+def to_matrix_frame(data):
+    df = pd.DataFrame(data, columns=scraped_columns)
+    matrix = pd.DataFrame({column: df[column].astype("category") for column in category_columns})
+    matrix["所要時間上限"] = range_upper_series(df["所要時間範囲"])
+    # 所要時間が読めないか時間範囲に収まらない行は時間範囲の上限で代用
+    commute, _ = commute_columns(df)
+    matrix["所要分"] = commute["所要分"]
+    matrix["乗換回数"] = commute["乗換回数"]
+    return matrix
+
+# マトリクスを保存（文字列列は辞書エンコードされる）
+def write_matrix(data, path=matrix_path):
+    matrix = to_matrix_frame(data)
+    matrix.to_parquet(path, index=False, compression="zstd")
+    return len(matrix)
+
+# 全出発駅から条件内で到達できる駅（出発駅ごとの最短所要分と、その最大値）
+def reachable_from_all(max_minutes, max_transfers, origins=None, path=matrix_path):
+    df = pd.read_parquet(
+        path,
+        columns=["origin", "駅名", "所要分", "乗換回数"],
+        filters=[("所要分", "<=", max_minutes), ("乗換回数", "<=", max_transfers)],
+    )
+    if origins:
+        df = df[df["origin"].isin(origins)]
+    else:
+        origins = list(pd.read_parquet(path, columns=["origin"])["origin"].cat.categories)
+
+    best = df.groupby(["駅名", "origin"], observed=True)["所要分"].min().unstack("origin")
+    best = best.reindex(columns=origins).dropna()
+    best["最大所要分"] = best.max(axis=1)
+    return best.sort_values("最大所要分").reset_index()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max-minutes", type=int, default=30, help="所要時間の上限（分）")
+    parser.add_argument("--max-transfers", type=int, default=1, help="乗り換え回数の上限")
+    parser.add_argument("--origins", nargs="+", help="対象の出発駅ノード（省略時は全出発駅）")
+    args = parser.parse_args()
+
+    result = reachable_from_all(args.max_minutes, args.max_transfers, args.origins)
+    print(result.to_string(index=False))
+    print(f"{len(result)}駅")
+
+if __name__ == "__main__":
+    main()
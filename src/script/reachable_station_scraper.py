@@ -1,9 +1,18 @@
 from selenium import webdriver
-from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException
 import pandas as pd
+import argparse
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from page_cache import PageCache
+from navitime_parser import parse_reachable_html
+from rate_limiter import AdaptiveRateLimiter
+from reachability_matrix import write_matrix, matrix_path
+from data_store import write_dataset
 
 # ChromeDriverの設定
 options = Options()
@@ -25,66 +34,202 @@ time_ranges = [
     (51, 60),
 ]
 
-data = []
+columns = ["駅名", "所要時間範囲", "所要時間", "乗り換え回数", "路線名"]
 
-# WebDriverの起動
-service = Service("./src/data/chromedriver.exe")  # ChromeDriverの相対パス
-with webdriver.Chrome(service=service, options=options) as driver:
-    for lower_term, higher_term in time_ranges:
-        url = f"{base_url}?node={node}&lower_term={lower_term}&higher_term={higher_term}&transit_limit={transit_limit}"
+# アクセス間隔の制御
+rate_limiter = AdaptiveRateLimiter("navitime", rate=0.5, max_rate=2.0)
+
+# ページ読み込み完了の判定
+ready_timeout = 15  # 秒
+ready_poll_interval = 0.2  # 秒
+wait_times = []  # ページごとの実際の待機時間（秒）
+timeouts = 0
+wait_stats_lock = threading.Lock()  # マトリクス作成時は複数ワーカーから更新される
+
+# 路線リストと駅リストの件数、結果欄（#text-area）が読み込み済みかを1回のスクリプト実行で取得
+count_script = """
+return [
+    document.querySelectorAll('#text-area > ul > li').length,
+    document.querySelectorAll('#text-area > ul > li div.station-info-area').length,
+    document.readyState === 'complete' && document.querySelector('#text-area') !== null
+];
+"""
+
+# 件数が連続2回変わらなくなったら読み込み完了とみなす
+# 件数0（その時間範囲に駅がない）は、結果欄が読み込み済みの場合だけ完了とする
+class list_is_stable:
+    def __init__(self):
+        self.last_counts = None
+
+    def __call__(self, driver):
+        counts = driver.execute_script(count_script)
+        stable = counts == self.last_counts and (counts[0] > 0 or counts[2])
+        self.last_counts = counts
+        return stable
+
+# ページの読み込み完了を待ち、待機時間を記録（タイムアウトした場合はFalse）
+def wait_until_ready(driver, url):
+    global timeouts
+    start = time.perf_counter()
+    ready = True
+    try:
+        WebDriverWait(driver, ready_timeout, poll_frequency=ready_poll_interval).until(list_is_stable())
+    except TimeoutException:
+        ready = False
+        print(f"読み込み待ちがタイムアウトしました（{ready_timeout}秒）: {url}")
+    elapsed = time.perf_counter() - start
+    with wait_stats_lock:
+        wait_times.append(elapsed)
+        timeouts += int(not ready)
+    print(f"読み込み待ち: {elapsed:.2f}秒")
+    return ready
+
+# 待機時間の集計
+def wait_summary():
+    with wait_stats_lock:
+        times = list(wait_times)
+        timeout_count = timeouts
+    if not times:
+        return "読み込み待ち: 0ページ"
+    average = sum(times) / len(times)
+    return f"読み込み待ち: {len(times)}ページ, 平均 {average:.2f}秒, 最大 {max(times):.2f}秒, タイムアウト {timeout_count}件"
+
+# 出発駅・時間範囲ごとのURL
+def build_url(lower_term, higher_term, origin=node):
+    return f"{base_url}?node={origin}&lower_term={lower_term}&higher_term={higher_term}&transit_limit={transit_limit}"
+
+# 1ページ分のHTMLを取得（driverがNoneならキャッシュのみを使い、なければNone）
+def fetch_reachable_html(driver, url, page_cache=None):
+    page_html = None
+    if page_cache:
+        page_html = page_cache.get(url, allow_stale=driver is None)
+    if page_html is None:
+        if driver is None:
+            print(f"キャッシュなし、スキップします: {url}")
+            return None
         print(f"アクセス中: {url}")  # URLログ出力
-        driver.get(url)
-        time.sleep(3)  # ページの読み込みを待つ
-
-        # li要素を取得
-        list_items = driver.find_elements(By.CSS_SELECTOR, "#text-area > ul > li")
-        print(f"時間範囲 {lower_term}-{higher_term}分: {len(list_items)}件のリストを取得")
-
-        for item in list_items:
-            # 路線名の取得
-            try:
-                route_name = item.find_element(By.CSS_SELECTOR, "h2").text
-                print(f"路線名: {route_name}")
-            except Exception as e:
-                route_name = ""
-                print(f"路線名取得エラー: {e}")
-
-            # 駅情報を取得
-            station_items = item.find_elements(By.CSS_SELECTOR, "ul > li > div.station-info-area")
-            print(f"駅情報: {len(station_items)}件取得")
-            for station in station_items:
-                try:
-                    station_name = station.find_element(By.CSS_SELECTOR, "div.station-name").text
-                except Exception as e:
-                    station_name = ""
-                    print(f"駅名取得エラー: {e}")
-
-                try:
-                    transit_time = station.find_element(By.CSS_SELECTOR, "div.station-note > span.time").text
-                except Exception as e:
-                    transit_time = ""
-                    print(f"所要時間取得エラー: {e}")
-
-                try:
-                    transfer_count = station.find_element(By.CSS_SELECTOR, "div.station-note > span.transit-count").text
-                except Exception as e:
-                    transfer_count = ""
-                    print(f"乗り換え回数取得エラー: {e}")
-
-                print(f"データ: 駅名={station_name}, 所要時間={transit_time}, 乗り換え回数={transfer_count}, 路線名={route_name}")
-                data.append([
-                    station_name,
-                    f"{lower_term}-{higher_term}分",
-                    transit_time,
-                    transfer_count,
-                    route_name,
-                ])
-
-# DataFrameに変換
-columns = ["駅名", "所要時間範囲", "所要時間", "乗り換え回数", "路線名"]
-df = pd.DataFrame(data, columns=columns)
+        rate_limiter.call(driver.get, url)
+        ready = wait_until_ready(driver, url)  # ページの読み込みを待つ
+        # DOMのスナップショットを1回だけ取得
+        page_html = driver.page_source
+        # 読み込み途中かもしれないページは --replay で再利用しないようキャッシュしない
+        if page_cache and ready:
+            page_cache.put(url, page_html)
+    return page_html
+
+# 全時間範囲のページを取得して解析（driverがNoneならキャッシュのみを使う）
+def scrape_reachable_stations(driver, page_cache=None, origin=node):
+    data = []
+    for lower_term, higher_term in time_ranges:
+        page_html = fetch_reachable_html(driver, build_url(lower_term, higher_term, origin), page_cache)
+        if page_html is None:
+            continue
+
+        # ページ全体を一度に解析
+        rows = parse_reachable_html(page_html, f"{lower_term}-{higher_term}分")
+        print(f"{origin} 時間範囲 {lower_term}-{higher_term}分: {len(rows)}件の駅を取得")
+        data.extend(rows)
+    return data
+
+# 複数の出発駅について (出発駅, 時間範囲) のページを並列に取得（ワーカーごとにドライバーを持つ）
+def scrape_origin_matrix(origins, workers=4, page_cache=None, replay=False):
+    local = threading.local()
+    drivers = []
+    drivers_lock = threading.Lock()
+
+    def worker_driver():
+        if replay:
+            return None
+        if not hasattr(local, "driver"):
+            service = Service("./src/data/chromedriver.exe")
+            local.driver = webdriver.Chrome(service=service, options=options)
+            with drivers_lock:
+                drivers.append(local.driver)
+        return local.driver
+
+    def scrape_job(job):
+        origin, lower_term, higher_term = job
+        try:
+            page_html = fetch_reachable_html(worker_driver(), build_url(lower_term, higher_term, origin), page_cache)
+        except Exception as e:
+            print(f"{origin} 時間範囲 {lower_term}-{higher_term}分の取得エラー: {e}")
+            return []
+        if page_html is None:
+            return []
+        rows = parse_reachable_html(page_html, f"{lower_term}-{higher_term}分")
+        print(f"{origin} 時間範囲 {lower_term}-{higher_term}分: {len(rows)}件の駅を取得")
+        return [[origin] + row for row in rows]
+
+    jobs = [(origin, lower_term, higher_term) for origin in origins for lower_term, higher_term in time_ranges]
+    data = []
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for rows in executor.map(scrape_job, jobs):
+                data.extend(rows)
+    finally:
+        for driver in drivers:
+            driver.quit()
+    return data
+
+# 出発駅リストの読み込み（1行1ノード、#以降はコメント）
+def read_origins(path):
+    origins = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            origin = line.split("#", 1)[0].strip()
+            if origin:
+                origins.append(origin)
+    return origins
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--replay", action="store_true", help="キャッシュ済みページのみから再解析する")
+    parser.add_argument("--no-cache", action="store_true", help="ページキャッシュを使わない")
+    parser.add_argument("--cache-ttl", type=float, default=0,
+                        help="キャッシュ済みページを再利用する期限（時間、0なら保存のみで再利用しない）")
+    parser.add_argument("--origins", nargs="+", help="出発駅ノード（複数指定で到達駅マトリクスを作成）")
+    parser.add_argument("--origins-file", help="出発駅ノードの一覧ファイル（1行1ノード）")
+    parser.add_argument("--workers", type=int, default=4, help="マトリクス作成時の並列ワーカー数")
+    parser.add_argument("--csv", action="store_true", help="Parquetに加えてCSVも出力する")
+    args = parser.parse_args()
+
+    page_cache = None
+    if args.replay or not args.no_cache:
+        page_cache = PageCache(ttl=args.cache_ttl * 60 * 60)
+
+    origins = list(args.origins or [])
+    if args.origins_file:
+        origins += read_origins(args.origins_file)
+    if origins:
+        # 出発駅 × 駅 × 時間範囲 × 乗り換え回数 のマトリクスを出力
+        data = scrape_origin_matrix(origins, args.workers, page_cache, args.replay)
+        print(rate_limiter.summary())
+        if page_cache:
+            print(page_cache.summary())
+        print(wait_summary())
+        row_count = write_matrix(data)
+        print(f"到達駅マトリクスを保存しました（{len(origins)}出発駅, {row_count}行）: {matrix_path}")
+        return
+
+    if args.replay:
+        data = scrape_reachable_stations(None, page_cache)
+    else:
+        # WebDriverの起動
+        service = Service("./src/data/chromedriver.exe")  # ChromeDriverの相対パス
+        with webdriver.Chrome(service=service, options=options) as driver:
+            data = scrape_reachable_stations(driver, page_cache)
+
+    print(rate_limiter.summary())
+    if page_cache:
+        print(page_cache.summary())
+    print(wait_summary())
+
+    # DataFrameに変換
+    df = pd.DataFrame(data, columns=columns)
+
+    # 保存（Parquet、指定があればCSVも）
+    output_path = write_dataset(df, "reachable_stations", csv=args.csv)
+    print(f"データのスクレイピングと保存が完了しました: {output_path}")
 
-# CSV出力
-output_path = "./output/reachable_stations.csv"
-df.to_csv(output_path, index=False, encoding="utf-8-sig")
-print(f"データのスクレイピングと保存が完了しました: {output_path}")
+if __name__ == "__main__":
+    main()
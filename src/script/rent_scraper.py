@@ -1,18 +1,43 @@
 import os
 import re
+import sys
 import time
+import argparse
 import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.options import Options
+from crawl_scheduler import CrawlScheduler, retry_backoff
+from page_cache import PageCache
+from crawl_journal import CrawlJournal
+from listing_index import ListingIndex
+from rate_limiter import AdaptiveRateLimiter
+from data_store import write_dataset
+from snapshot_store import append_snapshot
+from suumo_parser import parse_price, make_record, parse_listing_html, BlockedPageError
 
-# ChromeDriverの設定
-service = Service("./src/data/chromedriver.exe")
-options = Options()
-# options.add_argument("--headless")  # ヘッドレスモード（表示なし）
-options.add_argument("--disable-gpu")
-driver = webdriver.Chrome(service=service, options=options)
+# ChromeDriverの設定（ワーカーごとに1つ起動する）
+def create_driver():
+    service = Service("./src/data/chromedriver.exe")
+    options = Options()
+    # options.add_argument("--headless")  # ヘッドレスモード（表示なし）
+    options.add_argument("--disable-gpu")
+    return webdriver.Chrome(service=service, options=options)
+
+# HTTPセッションの設定（Chrome不要、keep-aliveで接続を再利用する）
+def create_http_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36",
+        "Accept-Language": "ja",
+    })
+    return session
 
 # 地域ごとの設定（新しいURL）
 regions = {
@@ -31,7 +56,7 @@ regions = {
 }
 
 # 最大ページ数を動的に取得
-def get_max_pages():
+def get_max_pages(driver):
     error_pop = driver.find_elements(By.CSS_SELECTOR, "#js-leftColumnForm > div.error_pop.error_pop--fr > div")
     return len(error_pop) == 0  # エラーがない場合、次のページが存在
 
@@ -39,86 +64,216 @@ def get_max_pages():
 output_dir = "./output"
 os.makedirs(output_dir, exist_ok=True)
 
-# データ取得関数
-def scrape_region(region_name, region_info):
-    region_dir = os.path.join(output_dir, region_name)
-    os.makedirs(region_dir, exist_ok=True)
-    all_data = []
+# 表示中のページから物件データを取得
+def parse_properties(driver):
+    page_data = []
+
+    # 各物件情報を取得
+    properties = driver.find_elements(By.CSS_SELECTOR, "#js-bukkenList > ul > li")
+    for property in properties:
+        # 建物種別
+        building_type = property.find_element(By.CSS_SELECTOR, ".cassetteitem_content-label > span").text
+
+        # 建物名
+        building_name = property.find_element(By.CSS_SELECTOR, ".cassetteitem_content-title").text
+
+        # 路線情報（元データ）
+        line_info = property.find_element(By.CSS_SELECTOR, ".cassetteitem_detail-col2 > div:nth-child(1)").text
+
+        # 賃料・管理費を取得し、月額を計算
+        rows = property.find_elements(By.CSS_SELECTOR, ".cassetteitem-item > table > tbody > tr")
+        for row in rows:
+            try:
+                rent_text = row.find_element(By.CSS_SELECTOR, "td:nth-child(4) > ul > li:nth-child(1) > span > span").text
+                management_fee_text = row.find_element(By.CSS_SELECTOR, "td:nth-child(4) > ul > li:nth-child(2) > span").text
+                rent, management_fee, monthly_cost = parse_price(rent_text, management_fee_text)
+
+            except Exception as e:
+                print(f"Error processing rent or management fee: {e}")
+                rent, management_fee, monthly_cost = None, None, None
+
+            # データを格納
+            page_data.append(make_record(building_type, building_name, line_info, rent, management_fee, monthly_cost))
+
+    return page_data
+
+# 同じ地域で連続してこの回数だけ取得に失敗したら、完了扱いにせず打ち切る（次回は失敗したページから再開）
+max_consecutive_errors = 5
+
+# ページキャッシュ（mainで設定、Noneならキャッシュしない）
+page_cache = None
+
+# アクセス間隔の制御（全ワーカーで共有）
+rate_limiter = AdaptiveRateLimiter("suumo", rate=2.0, max_rate=10.0)
+
+# ブラウザでページを開く（driver.get はステータスを返さないので、一覧も最終ページの表示もなければ
+# アクセス制限・エラーページとして例外にし、レート制御で失敗として数えて再試行する）
+def open_listing_page(driver, url):
+    driver.get(url)
+    if get_max_pages(driver) and not driver.find_elements(By.CSS_SELECTOR, "#js-bukkenList"):
+        raise BlockedPageError(f"no listing on page (blocked or error page): {driver.title}")
+
+# HTTPでページを取得して解析（エラーステータスとアクセス制限ページは例外にして再試行対象にする）
+def get_listing(session, url):
+    response = session.get(url, timeout=30)
+    response.raise_for_status()
+    return response.content, parse_listing_html(response.content)
+
+# 1ページ分を取得（最終ページを超えた場合はNone）
+def fetch_page(driver, url):
+    # キャッシュが有効期限内ならブラウザを使わない
+    cached = page_cache.get(url) if page_cache else None
+    if cached is not None:
+        return parse_listing_html(cached)
+
+    rate_limiter.call(open_listing_page, driver, url)
+    if page_cache:
+        page_cache.put(url, driver.page_source)
+
+    # 最大ページ判定
+    if not get_max_pages(driver):
+        return None
+
+    return parse_properties(driver)
+
+# 1ページ分をHTTPで取得し、lxmlで解析（最終ページを超えた場合はNone）
+def fetch_page_http(session, url):
+    cached = page_cache.get(url) if page_cache else None
+    if cached is not None:
+        return parse_listing_html(cached)
+
+    content, rows = rate_limiter.call(get_listing, session, url)
+    if page_cache:
+        page_cache.put(url, content)
+    return rows
+
+# キャッシュのみから再解析（ネットワークは使わない）
+# 最終ページの次のページ（最終ページの表示）もキャッシュされているので、キャッシュにないページはエラーとする
+def fetch_page_replay(session, url):
+    cached = page_cache.get(url, allow_stale=True)
+    if cached is None:
+        raise LookupError(f"Not in cache: {url}")
+    return parse_listing_html(cached)
+
+# 取得方式ごとの (セッション生成, ページ取得, セッション終了)
+backends = {
+    "selenium": (create_driver, fetch_page, lambda driver: driver.quit()),
+    "http": (create_http_session, fetch_page_http, lambda session: session.close()),
+    "replay": (lambda: None, fetch_page_replay, lambda session: None),
+}
+
+# 差分クロール（mainで設定、地域名 -> ListingIndex）
+listing_indexes = {}
+
+# 新着順に並べ替えたURL
+def newest_first_url(url):
+    url = re.sub(r"&po[12]=\d*", "", url)
+    return url.replace("&page=", "&po1=09&po2=99&page=")
+
+# 差分クロールを有効化（新着順で取得し、既知物件インデックスを読み込む）
+def enable_incremental():
+    for region_name, info in regions.items():
+        info["url"] = newest_first_url(info["url"])
+        listing_indexes[region_name] = ListingIndex(os.path.join(output_dir, region_name))
+
+# 既知物件だけのページを最終ページとして扱うページ取得
+def with_incremental_stop(fetch):
+    def fetch_incremental(session, url):
+        rows = fetch(session, url)
+        for region_name, index in listing_indexes.items():
+            if url.startswith(regions[region_name]["url"]):
+                if rows is not None and index.all_known(rows):
+                    index.stopped_early = True
+                    return None
+        return rows
+    return fetch_incremental
+
+# 地域のジャーナルを開く（完了済み、またはrestart指定なら最初から）
+def open_journal(region_name, restart=False):
+    journal = CrawlJournal(os.path.join(output_dir, region_name))
+    if restart or journal.complete:
+        journal.reset()
+    elif journal.last_page > 0:
+        print(f"Resuming {region_name} from page {journal.last_page + 1}")
+    return journal
+
+# ジャーナルから地域データをCSV保存
+def save_region(region_name, journal):
+    journal.mark_complete()
+    output_file = os.path.join(output_dir, region_name, "scraped_data.csv")
+    index = listing_indexes.get(region_name)
+    if index is None:
+        row_count = journal.export_csv(output_file)
+        print(f"Saved {region_name} data ({row_count} rows) to {output_file}")
+        return
 
-    page = 1
+    # 差分クロール：インデックスへ反映し、全件スナップショットと差分ファイルを出力
+    rows = (row for _, page_rows in journal.iter_pages() for row in page_rows)
+    delta = index.apply(rows, full_crawl=not index.stopped_early)
+    index.save()
+    row_count = index.export_snapshot(output_file)
+    delta_counts = index.export_delta(delta)
+    print(f"Saved {region_name} snapshot ({row_count} rows) to {output_file}, delta: {delta_counts}")
+
+# データ取得関数（1地域を1ドライバーで順番に取得し、ページごとにジャーナルへ追記）
+# 取得に失敗したページは待ってから取り直し、連続 max_consecutive_errors 回失敗したら完了にせず例外を投げる
+def scrape_region(region_name, region_info, driver, fetch=fetch_page, restart=False):
+    journal = open_journal(region_name, restart)
+
+    page = journal.last_page + 1
+    errors = 0
     while True:
         url = f"{region_info['url']}{page}"
-        driver.get(url)
-        # time.sleep(1)  # 1秒間隔
+
+        try:
+            page_data = fetch(driver, url)
+        except Exception as e:
+            errors += 1
+            print(f"Error on page {page} of {region_name} ({errors}/{max_consecutive_errors}): {e}")
+            if errors >= max_consecutive_errors:
+                print(f"Giving up {region_name} at page {page}; rerun to resume from this page")
+                raise
+            time.sleep(retry_backoff(errors))
+            continue
+        errors = 0
 
         # 最大ページ判定
-        if not get_max_pages():
+        if page_data is None:
             print(f"Reached last page for {region_name}. Total pages: {page-1}")
             break
 
-        try:
-            # 各物件情報を取得
-            properties = driver.find_elements(By.CSS_SELECTOR, "#js-bukkenList > ul > li")
-            for property in properties:
-                # 建物種別
-                building_type = property.find_element(By.CSS_SELECTOR, ".cassetteitem_content-label > span").text
-
-                # 建物名
-                building_name = property.find_element(By.CSS_SELECTOR, ".cassetteitem_content-title").text
-
-                # 路線情報（元データ）
-                line_info = property.find_element(By.CSS_SELECTOR, ".cassetteitem_detail-col2 > div:nth-child(1)").text
-
-                # 駅名
-                match = re.search(r"/(.+?)駅", line_info)
-                station_name = match.group(1) if match else None
-
-                # 賃料・管理費を取得し、月額を計算
-                rows = property.find_elements(By.CSS_SELECTOR, ".cassetteitem-item > table > tbody > tr")
-                for row in rows:
-                    try:
-                        rent_text = row.find_element(By.CSS_SELECTOR, "td:nth-child(4) > ul > li:nth-child(1) > span > span").text
-                        management_fee_text = row.find_element(By.CSS_SELECTOR, "td:nth-child(4) > ul > li:nth-child(2) > span").text
-
-                        # 賃料を「万円」単位に変換
-                        rent = float(rent_text.replace("万円", "").strip())
-
-                        # 管理費を「万円」単位に変換
-                        if management_fee_text == "-":
-                            management_fee = 0  # 管理費が`-`の場合は0
-                        else:
-                            management_fee = float(management_fee_text.replace("円", "").replace(",", "").strip()) / 10000  # 円を万円に変換
-
-                        # 月額を計算
-                        monthly_cost = rent + management_fee
-
-                    except Exception as e:
-                        print(f"Error processing rent or management fee: {e}")
-                        rent, management_fee, monthly_cost = None, None, None
-
-                    # データを格納
-                    all_data.append({
-                        "建物種別": building_type,
-                        "建物名": building_name,
-                        "路線情報": line_info,
-                        "駅名": station_name,
-                        "賃料": rent,
-                        "管理費": management_fee,
-                        "月額": monthly_cost,
-                    })
-        except Exception as e:
-            print(f"Error on page {page} of {region_name}: {e}")
-
+        journal.append_page(page, page_data)
         page += 1
 
-    # CSV保存
-    df = pd.DataFrame(all_data)
-    output_file = os.path.join(region_dir, "scraped_data.csv")
-    df.to_csv(output_file, index=False, encoding="utf-8-sig")
-    print(f"Saved {region_name} data to {output_file}")
+    save_region(region_name, journal)
 
-# 全データをマージ
-def merge_data():
+# 全地域を並列に取得（ワーカーごとにドライバーを持ち、(地域, ページ)のジョブを共有キューから取る）
+# 連続エラーで打ち切った地域は保存せず（ジャーナルは未完了のまま、次回は失敗したページから再開）、その一覧を返す
+def scrape_all(workers=4, per_host_limit=4, backend="selenium", restart=False):
+    journals = {region: open_journal(region, restart) for region in regions}
+    open_session, fetch, close_session = backends[backend]
+    if listing_indexes:
+        fetch = with_incremental_stop(fetch)
+    scheduler = CrawlScheduler(
+        {region: info["url"] for region, info in regions.items()},
+        open_session=open_session,
+        fetch_page=fetch,
+        close_session=close_session,
+        workers=workers,
+        per_host_limit=per_host_limit,
+        max_consecutive_errors=max_consecutive_errors,
+        start_pages={region: journal.last_page + 1 for region, journal in journals.items()},
+        on_page=lambda region, page, rows: journals[region].append_page(page, rows),
+        on_region_done=lambda region, end_page: save_region(region, journals[region]),
+        on_region_failed=lambda region, page: print(f"{region} is incomplete; rerun to resume from page {page}"),
+    )
+    start = time.perf_counter()
+    scheduler.run()
+    print(f"Scraped {len(regions)} regions with {workers} workers in {time.perf_counter() - start:.1f}s")
+    return scheduler.failed_regions
+
+# 全データをマージ（snapshot=Trueなら履歴スナップショットにも追記する）
+def merge_data(csv=False, snapshot=True):
     merged_data = []
     for region in regions.keys():
         file_path = os.path.join(output_dir, region, "scraped_data.csv")
@@ -128,20 +283,84 @@ def merge_data():
 
     if merged_data:
         merged_df = pd.concat(merged_data, ignore_index=True)
-        merged_df.to_csv(os.path.join(output_dir, "merged_data.csv"), index=False, encoding="utf-8-sig")
-        print("Saved merged data to ./output/merged_data.csv")
+        output_path = write_dataset(merged_df, "merged_data", csv=csv)
+        print(f"Saved merged data to {output_path}")
+
+        # 履歴スナップショットに差分を追記（merged_data は毎回上書きされるため）
+        # データのない地域がある場合は、その地域の物件を削除と記録しないよう追記しない
+        if not snapshot:
+            return
+        if len(merged_data) < len(regions):
+            print("Some regions have no scraped data, skipped snapshot")
+            return
+        summary = append_snapshot(merged_df)
+        if summary is None:
+            print("No listings merged, skipped snapshot")
+            return
+        print(f"Snapshot v{summary['version']} ({summary['date']}): {summary['listings']} listings, "
+              f"{summary['added']} added, {summary['removed']} removed")
 
 # メイン関数
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4, help="並列ワーカー数（1なら従来通り順番に取得）")
+    parser.add_argument("--per-host-limit", type=int, default=4, help="同一ホストへの同時接続数の上限")
+    parser.add_argument("--backend", choices=["selenium", "http"], default="selenium",
+                        help="selenium: Chromeで描画 / http: HTTP取得+lxml解析（Chrome不要）")
+    parser.add_argument("--replay", action="store_true", help="キャッシュ済みページのみから再解析する")
+    parser.add_argument("--no-cache", action="store_true", help="ページキャッシュを使わない")
+    parser.add_argument("--cache-ttl", type=float, default=0,
+                        help="キャッシュ済みページを再利用する期限（時間、0なら保存のみで再利用しない）")
+    parser.add_argument("--restart", action="store_true", help="チェックポイントを破棄して1ページ目から取得する")
+    parser.add_argument("--rate", type=float, default=2.0, help="開始時の秒あたりリクエスト数（応答に応じて自動調整）")
+    parser.add_argument("--max-rate", type=float, default=10.0, help="秒あたりリクエスト数の上限")
+    parser.add_argument("--csv", action="store_true", help="マージ済みデータをParquetに加えてCSVでも出力する")
+    parser.add_argument("--incremental", action="store_true",
+                        help="新着順に取得し、既知物件だけのページで打ち切って差分(delta.csv)を出力する")
+    args = parser.parse_args()
+
+    global page_cache, max_consecutive_errors
+    rate_limiter.rate = args.rate
+    rate_limiter.max_rate = args.max_rate
+    if args.replay or not args.no_cache:
+        page_cache = PageCache(ttl=args.cache_ttl * 60 * 60)
+    if args.replay:
+        args.backend = "replay"
+        args.restart = True
+        # キャッシュにないページは取り直しても見つからないので、最初の失敗で地域を打ち切る（保存・マージしない）
+        max_consecutive_errors = 1
+    if args.incremental:
+        enable_incremental()
+
     # 地域ごとにスクレイピング
-    for region, info in regions.items():
-        scrape_region(region, info)
+    failed_regions = []
+    if args.workers <= 1:
+        open_session, fetch, close_session = backends[args.backend]
+        if listing_indexes:
+            fetch = with_incremental_stop(fetch)
+        session = open_session()
+        try:
+            for region, info in regions.items():
+                scrape_region(region, info, session, fetch, args.restart)
+        finally:
+            # ドライバー（セッション）を終了
+            close_session(session)
+    else:
+        failed_regions = scrape_all(args.workers, args.per_host_limit, args.backend, args.restart)
 
-    # 全データをマージ
-    merge_data()
+    print(rate_limiter.summary())
+    if page_cache:
+        print(page_cache.summary())
 
-    # ドライバーを終了
-    driver.quit()
+    # 取得しきれなかった地域があれば、マージと履歴スナップショットへの追記をせずに失敗として終了する
+    # （途中までのデータで掲載終了と記録しないため）
+    if failed_regions:
+        print(f"Incomplete regions: {', '.join(failed_regions)}; skipped merge and snapshot")
+        sys.exit(1)
+
+    # 全データをマージ
+    # --replay はキャッシュの再解析で新しい掲載状況ではないので、履歴には追記しない
+    merge_data(args.csv, snapshot=not args.replay)
 
 # エントリーポイント
 if __name__ == "__main__":
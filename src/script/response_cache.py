@@ -0,0 +1,45 @@
+import threading
+from collections import OrderedDict
+
+# 地図アプリのコールバック応答のキャッシュ（件数上限つきLRU）
+# キーにはフィルタの組み合わせとデータのバージョンを含め、データが更新されたら clear で破棄する
+
+
+class ResponseCache:
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # キャッシュ済みならそれを返し、なければ build() の結果を保存して返す
+    def get_or_build(self, key, build):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+
+        value = build()
+        with self.lock:
+            self.misses += 1
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def summary(self):
+        return f"{len(self.entries)} entries, {self.hits} hits, {self.misses} misses"
+
+
+# キャッシュした図（dict）に現在の表示範囲を反映する（元のdictは変更しない）
+def with_viewport(figure, map_state):
+    layout = figure.get("layout", {})
+    mapbox = {**layout.get("mapbox", {}), "center": map_state["center"], "zoom": map_state["zoom"]}
+    return {**figure, "layout": {**layout, "mapbox": mapbox}}
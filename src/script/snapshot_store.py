@@ -0,0 +1,199 @@
+import os
+import json
+import argparse
+from datetime import date
+import numpy as np
+import pandas as pd
+from listing_index import fingerprint
+from crawl_journal import columns, numeric_columns
+from data_store import read_dataset
+
+# 家賃データの履歴スナップショット（追記のみ、日付でパーティション分割したParquet）
+# 実行ごとの全物件は保存せず、前回のスナップショットからの差分（フィンガープリントで見た追加・削除）だけを
+# events/snapshot_date=YYYY-MM-DD/part-v00001.parquet に追記する。変わらない物件は何も書かないので、
+# 容量はスナップショットの回数ではなく変更の量に比例する。各バージョンの日付と件数は manifest.json に記録する
+store_dir = "./output/snapshots"
+events_dir = os.path.join(store_dir, "events")
+manifest_path = os.path.join(store_dir, "manifest.json")
+text_columns = [column for column in columns if column not in numeric_columns]
+
+
+# スナップショットの一覧（バージョン順）
+def read_manifest():
+    if not os.path.exists(manifest_path):
+        return []
+    with open(manifest_path, encoding="utf-8") as f:
+        return json.load(f)
+
+def _write_manifest(manifest):
+    os.makedirs(store_dir, exist_ok=True)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, manifest_path)
+
+# 差分イベントの読み込み（filters は pyarrow の条件。snapshot_date の条件はパーティション単位で読み飛ばす）
+def read_events(filters=None):
+    if not os.path.exists(events_dir):
+        return pd.DataFrame(columns=["fingerprint", "変更種別", "version"] + columns)
+    events = pd.read_parquet(events_dir, filters=filters)
+    return events.drop(columns=["snapshot_date"])
+
+# 物件ごとの掲載期間（追加されたバージョン start から削除されたバージョン end の手前まで。掲載中は end が無限大）
+def listing_intervals(events):
+    events = events.sort_values(["fingerprint", "version"], kind="stable").reset_index(drop=True)
+    next_version = events["version"].shift(-1).where(events["fingerprint"].shift(-1) == events["fingerprint"])
+    intervals = events[events["変更種別"] == "added"].copy()
+    intervals["start"] = intervals["version"].astype(float)
+    intervals["end"] = next_version[intervals.index].astype(float).fillna(np.inf)
+    return intervals.drop(columns=["変更種別", "version"]).reset_index(drop=True)
+
+# 物件データ（columns の列）をスナップショットとして追記し、追加・削除の件数を返す
+# 空のデータは取得の失敗とみなして追記しない（全物件を削除と記録しないため、Noneを返す）
+def append_snapshot(df, snapshot_date=None):
+    if df.empty:
+        return None
+    snapshot_date = snapshot_date or date.today().isoformat()
+    df = df[columns].astype({column: "float64" for column in numeric_columns})
+    df = df.astype({column: "string" for column in text_columns})
+    records = df.astype(object).where(df.notna(), None).to_dict("records")
+    df = df.assign(fingerprint=[fingerprint(record) for record in records])
+    # 同じフィンガープリントの部屋（同じ建物で金額も同じ）は出現順の番号を付けて別々に保存する（dedup_listings.py 参照）
+    occurrence = df.groupby("fingerprint").cumcount()
+    df["fingerprint"] = df["fingerprint"].where(occurrence == 0, df["fingerprint"] + "-" + occurrence.astype(str))
+
+    manifest = read_manifest()
+    version = manifest[-1]["version"] + 1 if manifest else 1
+    current = listing_intervals(read_events())
+    current = current[np.isinf(current["end"])]
+
+    added = df[~df["fingerprint"].isin(current["fingerprint"])].assign(変更種別="added")
+    removed = current[~current["fingerprint"].isin(df["fingerprint"])].assign(変更種別="removed")
+    events = pd.concat([added, removed[added.columns]], ignore_index=True).assign(version=version)
+    events = events[["fingerprint", "変更種別", "version"] + columns]
+
+    if len(events):
+        # 駅名順に並べて書く（駅名の条件で行グループの統計から読み飛ばせるようにする）
+        partition_dir = os.path.join(events_dir, f"snapshot_date={snapshot_date}")
+        os.makedirs(partition_dir, exist_ok=True)
+        events = events.sort_values(["駅名", "建物種別", "fingerprint"], kind="stable")
+        events = events.astype({"fingerprint": "string", "変更種別": "string", "version": "int32"})
+        events.to_parquet(os.path.join(partition_dir, f"part-v{version:05d}.parquet"), index=False,
+                          compression="zstd", row_group_size=50000)
+
+    summary = {
+        "version": version,
+        "date": snapshot_date,
+        "listings": len(df),
+        "added": len(added),
+        "removed": len(removed),
+    }
+    manifest.append(summary)
+    _write_manifest(manifest)
+    return summary
+
+# 日付の範囲内のスナップショット（start, end は YYYY-MM-DD、Noneなら制限なし）
+def snapshots_between(start=None, end=None):
+    return [
+        entry for entry in read_manifest()
+        if (start is None or entry["date"] >= start) and (end is None or entry["date"] <= end)
+    ]
+
+# 物件の掲載期間から、各バージョン時点の 駅名（など keys）ごとの月額の件数・平均・中央値を集計
+def alive_stats(intervals, versions, keys=()):
+    start = intervals["start"].to_numpy()
+    end = intervals["end"].to_numpy()
+    frames = []
+    for version in versions:
+        alive = intervals[(start <= version) & (version < end)]
+        if keys:
+            stats = alive.groupby(list(keys), observed=True)["月額"].agg(
+                件数="size", 月額_平均="mean", 月額_中央値="median"
+            ).reset_index()
+        else:
+            stats = pd.DataFrame({
+                "件数": [len(alive)], "月額_平均": [alive["月額"].mean()], "月額_中央値": [alive["月額"].median()]
+            })
+        stats.insert(0, "version", version)
+        frames.append(stats)
+    return pd.concat(frames, ignore_index=True)
+
+# 駅の月額の時系列（スナップショットごとの件数・平均・中央値）
+# 駅名・建物種別は行グループの統計、end はパーティション（snapshot_date）で読み飛ばす
+def station_series(station, building_type=None, start=None, end=None):
+    snapshots = snapshots_between(start, end)
+    if not snapshots:
+        return pd.DataFrame(columns=["date", "version", "件数", "月額_平均", "月額_中央値"])
+    filters = [("駅名", "==", station), ("snapshot_date", "<=", snapshots[-1]["date"])]
+    if building_type:
+        filters.append(("建物種別", "==", building_type))
+    intervals = listing_intervals(read_events(filters))
+    series = alive_stats(intervals, [entry["version"] for entry in snapshots])
+    series.insert(0, "date", [entry["date"] for entry in snapshots])
+    return series
+
+# 月ごとの最後のスナップショット（YYYY-MM -> manifestの項目）
+def monthly_snapshots():
+    months = {}
+    for entry in read_manifest():
+        months[entry["date"][:7]] = entry
+    return months
+
+# 駅ごとの月額中央値の前月比（month は YYYY-MM、省略時は最新の月）
+# その月の最後のスナップショットより後のパーティションは読まない
+def month_over_month(month=None, building_type=None):
+    months = monthly_snapshots()
+    if len(months) < 2:
+        raise ValueError("前月比には2か月分以上のスナップショットが必要です")
+    month_keys = sorted(months)
+    month = month or month_keys[-1]
+    if month not in months or month_keys.index(month) == 0:
+        raise ValueError(f"{month} と前月のスナップショットがありません")
+    previous = months[month_keys[month_keys.index(month) - 1]]
+    current = months[month]
+
+    filters = [("snapshot_date", "<=", current["date"])]
+    if building_type:
+        filters.append(("建物種別", "==", building_type))
+    intervals = listing_intervals(read_events(filters))
+    stats = alive_stats(intervals, [previous["version"], current["version"]], keys=["駅名"])
+    before = stats[stats["version"] == previous["version"]].set_index("駅名")
+    after = stats[stats["version"] == current["version"]].set_index("駅名")
+
+    result = pd.DataFrame({
+        "前月_中央値": before["月額_中央値"],
+        "当月_中央値": after["月額_中央値"],
+        "前月_件数": before["件数"],
+        "当月_件数": after["件数"],
+    })
+    result[["前月_件数", "当月_件数"]] = result[["前月_件数", "当月_件数"]].fillna(0).astype(int)
+    result["変化"] = result["当月_中央値"] - result["前月_中央値"]
+    result["変化率"] = result["変化"] / result["前月_中央値"]
+    return result.sort_values("変化率", ascending=False).reset_index()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--add", action="store_true", help="merged_data を今日のスナップショットとして追記する")
+    parser.add_argument("--date", help="追記するスナップショットの日付（YYYY-MM-DD、省略時は今日）")
+    parser.add_argument("--series", help="駅の月額の時系列を表示する（駅名）")
+    parser.add_argument("--mom", action="store_true", help="駅ごとの月額中央値の前月比を表示する")
+    parser.add_argument("--month", help="前月比の対象月（YYYY-MM、省略時は最新の月）")
+    parser.add_argument("--building-type", help="建物種別で絞り込む")
+    parser.add_argument("--start", help="時系列の開始日（YYYY-MM-DD）")
+    parser.add_argument("--end", help="時系列の終了日（YYYY-MM-DD）")
+    args = parser.parse_args()
+
+    if args.add:
+        summary = append_snapshot(read_dataset("merged_data", columns=columns), args.date)
+        if summary is None:
+            print("merged_data が空のため、スナップショットを追記しませんでした")
+            return
+        print(f"スナップショット v{summary['version']} ({summary['date']}): {summary['listings']}件, "
+              f"追加 {summary['added']}件, 削除 {summary['removed']}件")
+    if args.series:
+        print(station_series(args.series, args.building_type, args.start, args.end).to_string(index=False))
+    if args.mom:
+        print(month_over_month(args.month, args.building_type).to_string(index=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import os
+import difflib
+import pandas as pd
+from station_spatial_index import distance_km
+
+# 駅データ（station20240426free.csv）の駅名照合用インデックス
+station_data_file = "./src/data/station20240426free.csv"
+index_cache_file = "./output/cache/station_index.pkl"
+
+# 都道府県コード順の都道府県名
+pref_names = [
+    "北海道", "青森県", "岩手県", "宮城県", "秋田県", "山形県", "福島県", "茨城県", "栃木県", "群馬県",
+    "埼玉県", "千葉県", "東京都", "神奈川県", "新潟県", "富山県", "石川県", "福井県", "山梨県", "長野県",
+    "岐阜県", "静岡県", "愛知県", "三重県", "滋賀県", "京都府", "大阪府", "兵庫県", "奈良県", "和歌山県",
+    "鳥取県", "島根県", "岡山県", "広島県", "山口県", "徳島県", "香川県", "愛媛県", "高知県", "福岡県",
+    "佐賀県", "長崎県", "熊本県", "大分県", "宮崎県", "鹿児島県", "沖縄県",
+]
+
+# 括弧内の都道府県名（「東京都」「東京」どちらも可）-> 都道府県コード
+pref_hints = {}
+for pref_cd, pref_name in enumerate(pref_names, start=1):
+    pref_hints[pref_name] = pref_cd
+    if pref_name != "北海道":
+        pref_hints[pref_name[:-1]] = pref_cd
+
+# 括弧（NFKC正規化後の () [] と 〔〕）
+bracket_open = r"[(\[〔]"
+bracket_close = r"[)\]〕]"
+
+# 駅名の正規化（全角/半角の統一、括弧以降と末尾の「駅」の除去、ヶ/ケの統一）
+def normalize_station_names(names):
+    names = names.astype("string").str.normalize("NFKC")
+    names = names.str.replace(rf"\s*{bracket_open}.*$", "", regex=True)
+    names = names.str.replace(r"(?<=.)駅$", "", regex=True)
+    names = names.str.replace("ヶ", "ケ", regex=False).str.replace("ヵ", "カ", regex=False)
+    return names.str.replace(r"\s+", "", regex=True)
+
+# 括弧内の都道府県名から都道府県コードを取り出す（なければ欠損）
+def extract_pref_hints(names):
+    hints = names.astype("string").str.normalize("NFKC").str.extract(
+        rf"{bracket_open}(.*?){bracket_close}", expand=False
+    )
+    return hints.map(pref_hints).astype("Int64")
+
+# 元データの更新検知用の署名
+def _source_signature(path):
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+# 駅名インデックスを作成（運用中の駅のみ、正規化済みの駅名を持つ）
+def build_station_index(path=station_data_file):
+    stations = pd.read_csv(
+        path,
+        usecols=["station_cd", "station_g_cd", "station_name", "line_cd", "pref_cd",
+                 "address", "lon", "lat", "e_status", "e_sort"],
+    )
+    stations = stations[stations["e_status"] == 0].drop(columns=["e_status"])
+    stations["name_key"] = normalize_station_names(stations["station_name"])
+    return stations.sort_values(["name_key", "e_sort"]).reset_index(drop=True)
+
+# ディスクにキャッシュした駅名インデックスを読み込む（元データが変わっていれば作り直す）
+def load_station_index(path=station_data_file, cache_file=index_cache_file):
+    signature = _source_signature(path)
+    if os.path.exists(cache_file):
+        cached = pd.read_pickle(cache_file)
+        if cached.get("signature") == signature:
+            return cached["index"]
+
+    index = build_station_index(path)
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    pd.to_pickle({"signature": signature, "index": index}, cache_file)
+    return index
+
+# 駅名ごとに最も確からしい駅を1つ選ぶ
+# 同名駅は括弧内の都道府県が一致するものを優先し、次に出発地点（origin=(lon, lat)）に近い順、e_sort 順。
+# 完全一致しない駅名は類似度 cutoff 以上の駅名に寄せる
+def match_station_names(names, index, fuzzy_cutoff=0.8, origin=None):
+    queries = pd.DataFrame({"駅名": pd.Series(names).dropna().unique()})
+    queries["name_key"] = normalize_station_names(queries["駅名"])
+    queries["pref_hint"] = extract_pref_hints(queries["駅名"])
+
+    # 完全一致しない駅名は近い駅名に置き換える
+    known_keys = set(index["name_key"])
+    unknown = queries.loc[~queries["name_key"].isin(known_keys), "name_key"].unique()
+    key_list = list(known_keys)
+    fuzzy = {}
+    for key in unknown:
+        close = difflib.get_close_matches(key, key_list, n=1, cutoff=fuzzy_cutoff)
+        if close:
+            fuzzy[key] = close[0]
+    queries["match_key"] = queries["name_key"].replace(fuzzy)
+
+    candidates = queries.merge(index, left_on="match_key", right_on="name_key", suffixes=("", "_index"))
+    candidates["pref_match"] = (candidates["pref_hint"] == candidates["pref_cd"]).fillna(False)
+    if origin is not None:
+        candidates["origin_km"] = distance_km(origin[0], origin[1], candidates["lon"], candidates["lat"])
+    else:
+        candidates["origin_km"] = 0.0
+    candidates = candidates.sort_values(
+        ["駅名", "pref_match", "origin_km", "e_sort"], ascending=[True, False, True, True]
+    )
+    matched = candidates.drop_duplicates(subset=["駅名"], keep="first")
+    return matched.drop(
+        columns=["name_key_index", "match_key", "pref_hint", "pref_match", "origin_km"]
+    ).reset_index(drop=True)
@@ -0,0 +1,134 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+
+# 駅座標の空間インデックス（緯度経度の等間隔グリッド）
+# 駅をセル番号順に並べ、セルごとの開始位置（CSR形式）で範囲内の駅だけを取り出す
+station_data_file = "./src/data/station20240426free.csv"
+spatial_cache_file = "./output/cache/station_spatial_index.npz"
+earth_radius_km = 6371.0
+
+
+# 2点間の距離（km、ハーサイン）
+def distance_km(lon1, lat1, lon2, lat2):
+    lon1, lat1, lon2, lat2 = map(np.radians, (lon1, lat1, lon2, lat2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * earth_radius_km * np.arcsin(np.sqrt(a))
+
+
+class StationSpatialIndex:
+    def __init__(self, station_cd, lon, lat, cell_size=0.02, signature=None):
+        self.cell_size = cell_size  # 度（緯度方向で約2.2km）
+        self.signature = signature
+        self.origin_lon = float(np.min(lon))
+        self.origin_lat = float(np.min(lat))
+        self.nx = int((np.max(lon) - self.origin_lon) // cell_size) + 1
+        self.ny = int((np.max(lat) - self.origin_lat) // cell_size) + 1
+
+        cells = self._cell_x(lon) + self._cell_y(lat) * self.nx
+        order = np.argsort(cells, kind="stable")
+        self.station_cd = np.asarray(station_cd)[order]
+        self.lon = np.asarray(lon, dtype=float)[order]
+        self.lat = np.asarray(lat, dtype=float)[order]
+        # セルiの駅は starts[i]:starts[i+1]
+        self.starts = np.searchsorted(cells[order], np.arange(self.nx * self.ny + 1))
+
+    def _cell_x(self, lon):
+        return np.clip(((np.asarray(lon) - self.origin_lon) // self.cell_size).astype(int), 0, self.nx - 1)
+
+    def _cell_y(self, lat):
+        return np.clip(((np.asarray(lat) - self.origin_lat) // self.cell_size).astype(int), 0, self.ny - 1)
+
+    # 矩形範囲に掛かるセルの駅の位置
+    def _candidates(self, min_lon, min_lat, max_lon, max_lat):
+        x0, x1 = self._cell_x(min_lon), self._cell_x(max_lon)
+        y0, y1 = self._cell_y(min_lat), self._cell_y(max_lat)
+        ranges = [
+            np.arange(self.starts[y * self.nx + x0], self.starts[y * self.nx + x1 + 1])
+            for y in range(y0, y1 + 1)
+        ]
+        return np.concatenate(ranges) if ranges else np.empty(0, dtype=int)
+
+    # 矩形範囲内の駅（station_cdの配列）
+    def bbox(self, min_lon, min_lat, max_lon, max_lat):
+        positions = self._candidates(min_lon, min_lat, max_lon, max_lat)
+        inside = (
+            (self.lon[positions] >= min_lon) & (self.lon[positions] <= max_lon) &
+            (self.lat[positions] >= min_lat) & (self.lat[positions] <= max_lat)
+        )
+        return self.station_cd[positions[inside]]
+
+    # 半径km以内の駅（station_cd, 距離km）を近い順に
+    def radius(self, lon, lat, km):
+        dlat = km / 111.0
+        dlon = km / (111.0 * np.cos(np.radians(lat)))
+        positions = self._candidates(lon - dlon, lat - dlat, lon + dlon, lat + dlat)
+        distances = distance_km(lon, lat, self.lon[positions], self.lat[positions])
+        inside = distances <= km
+        positions, distances = positions[inside], distances[inside]
+        order = np.argsort(distances, kind="stable")
+        return self.station_cd[positions[order]], distances[order]
+
+    # 近い順にk駅（station_cd, 距離km）
+    def nearest(self, lon, lat, k=1):
+        km = self.cell_size * 111.0
+        while True:
+            station_cd, distances = self.radius(lon, lat, km)
+            if len(station_cd) >= k or km > 2 * earth_radius_km:
+                return station_cd[:k], distances[:k]
+            km *= 2
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez(path, station_cd=self.station_cd, lon=self.lon, lat=self.lat,
+                 cell_size=self.cell_size, signature=np.array(self.signature, dtype=object))
+
+    @classmethod
+    def load(cls, path):
+        saved = np.load(path, allow_pickle=True)
+        signature = tuple(saved["signature"]) if saved["signature"].shape else None
+        return cls(saved["station_cd"], saved["lon"], saved["lat"], float(saved["cell_size"]), signature)
+
+
+# 運用中の駅の座標
+def read_stations(path=station_data_file):
+    stations = pd.read_csv(path, usecols=["station_cd", "station_name", "line_cd", "lon", "lat", "e_status"])
+    return stations[stations["e_status"] == 0]
+
+# ディスクにキャッシュした空間インデックスを読み込む（元データが変わっていれば作り直す）
+def load_spatial_index(path=station_data_file, cache_file=spatial_cache_file):
+    stat = os.stat(path)
+    signature = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if os.path.exists(cache_file):
+        index = StationSpatialIndex.load(cache_file)
+        if index.signature == signature:
+            return index
+
+    stations = read_stations(path)
+    index = StationSpatialIndex(stations["station_cd"].to_numpy(), stations["lon"].to_numpy(),
+                                stations["lat"].to_numpy(), signature=signature)
+    index.save(cache_file)
+    return index
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lon", type=float, required=True)
+    parser.add_argument("--lat", type=float, required=True)
+    parser.add_argument("--km", type=float, default=1.0, help="検索半径（km）")
+    parser.add_argument("-k", type=int, default=5, help="最寄り駅の件数")
+    args = parser.parse_args()
+
+    index = load_spatial_index()
+    stations = read_stations().set_index("station_cd")
+
+    station_cd, distances = index.nearest(args.lon, args.lat, args.k)
+    print("最寄り駅:")
+    for cd, distance in zip(station_cd, distances):
+        print(f"  {stations.at[cd, 'station_name']} (line_cd={stations.at[cd, 'line_cd']}, {distance:.2f}km)")
+
+    station_cd, distances = index.radius(args.lon, args.lat, args.km)
+    print(f"{args.km}km以内: {len(station_cd)}駅")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+# チャンク単位で集計して結果を足し合わせるグループ集計（入力全体をメモリに載せない）
+# 部分集計は「件数・合計・最小/最大」と分位点用のスケッチ（対数バケットごとの件数）で、どれも足し算かmin/maxでマージできる。
+# 月額（万円）は円単位の整数に直して合計するので、チャンクの分け方や順序によらず合計が一致する
+relative_accuracy = 0.005  # スケッチの分位点の相対誤差
+gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+log_gamma = np.log(gamma)
+min_value = 1e-4  # これ未満の値は最小のバケットに入れる
+value_scale = 10000  # 万円 -> 円
+
+
+# 部分集計
+class PartialAggregate:
+    def __init__(self, stats, sketch):
+        self.stats = stats  # (キー) -> 件数, 合計（円）, 最小, 最大
+        self.sketch = sketch  # (キー, バケット) -> 件数
+
+    # 別の部分集計を足し合わせる
+    def merge(self, other):
+        if other is None:
+            return self
+        stats = pd.concat([self.stats, other.stats])
+        sketch = pd.concat([self.sketch, other.sketch])
+        merge_rules = {column: merge_rule(column) for column in stats.columns}
+        return PartialAggregate(
+            stats.groupby(level=list(range(stats.index.nlevels))).agg(merge_rules),
+            sketch.groupby(level=list(range(sketch.index.nlevels))).sum(),
+        )
+
+
+# 部分集計の列ごとのマージ方法（min/max以外は足し算）
+def merge_rule(column):
+    return column if column in ("min", "max") else "sum"
+
+
+# 円単位の整数に直す（欠損は0円）
+def to_fixed_point(values):
+    return np.rint(np.nan_to_num(np.asarray(values, dtype=float)) * value_scale).astype(np.int64)
+
+# 1チャンク分の部分集計（プロセスプールからも呼ぶのでモジュール直下に置く）
+# sum_columns の列は合計だけを持ち、finalizeで平均にする
+def partial_aggregate(chunk, keys, value, sum_columns=()):
+    chunk = chunk.dropna(subset=[value])
+    frame = pd.DataFrame({key: chunk[key].astype(str) for key in keys})
+    values = chunk[value].to_numpy(dtype=float)
+    frame["count"] = 1
+    frame["sum"] = to_fixed_point(values)
+    frame["min"] = values
+    frame["max"] = values
+    for column in sum_columns:
+        frame[f"sum_{column}"] = to_fixed_point(chunk[column])
+    frame["bucket"] = np.ceil(np.log(np.maximum(values, min_value)) / log_gamma).astype(np.int64)
+
+    stat_columns = ["count", "sum", "min", "max"] + [f"sum_{column}" for column in sum_columns]
+    stats = frame.groupby(keys, sort=False)[stat_columns].agg({column: merge_rule(column) for column in stat_columns})
+    sketch = frame.groupby(keys + ["bucket"], sort=False)["count"].sum()
+    return PartialAggregate(stats, sketch)
+
+# チャンクを順に部分集計してマージする（workers>1ならプロセスプールに分散）
+# 実行中のチャンクは workers*2 個までにして、読み込み済みデータが溜まらないようにする
+def aggregate_chunks(chunks, keys, value, workers=1, sum_columns=()):
+    total = None
+    if workers <= 1:
+        for chunk in chunks:
+            total = partial_aggregate(chunk, keys, value, sum_columns).merge(total)
+        return total
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        running = set()
+        for chunk in chunks:
+            running.add(executor.submit(partial_aggregate, chunk, keys, value, sum_columns))
+            if len(running) >= workers * 2:
+                finished, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    total = future.result().merge(total)
+        for future in running:
+            total = future.result().merge(total)
+    return total
+
+# 部分集計から件数・平均・最小/最大・分位点の表を作る（入力が空でtotalがNoneなら列だけの表）
+def finalize(total, keys, value, quantiles=(), sum_columns=()):
+    if total is None:
+        columns = (keys + ["件数", value, f"{value}_最小", f"{value}_最大"]
+                   + [f"{column}_平均" for column in sum_columns] + [label for label, _ in quantiles])
+        return pd.DataFrame(columns=columns)
+    stats = total.stats.sort_index()
+    result = pd.DataFrame({
+        "件数": stats["count"],
+        value: stats["sum"] / value_scale / stats["count"],
+        f"{value}_最小": stats["min"],
+        f"{value}_最大": stats["max"],
+    })
+    for column in sum_columns:
+        result[f"{column}_平均"] = stats[f"sum_{column}"] / value_scale / stats["count"]
+
+    # 分位点：前後の順位の値（累積件数が順位を超える最初のバケットの代表値）を線形補間する
+    sketch = total.sketch.sort_index()
+    group_levels = list(range(len(keys)))
+    cumulative = sketch.groupby(level=group_levels).cumsum().to_numpy()
+    group_count = stats["count"].reindex(sketch.index.droplevel(-1)).to_numpy()
+    buckets = sketch.index.get_level_values(-1).to_numpy()
+    representative = 2 * np.power(gamma, buckets) / (gamma + 1)
+
+    def value_at_rank(rank):
+        above = cumulative > rank
+        first = pd.Series(representative[above], index=sketch.index[above]).groupby(level=group_levels).first()
+        return first.reindex(result.index).to_numpy()
+
+    for label, q in quantiles:
+        position = q * (group_count - 1)
+        lower = value_at_rank(np.floor(position))
+        upper = value_at_rank(np.ceil(position))
+        fraction = (q * (result["件数"] - 1)) % 1
+        # 最小/最大は正確なので、その範囲に収める
+        result[label] = (lower + (upper - lower) * fraction).clip(result[f"{value}_最小"], result[f"{value}_最大"])
+
+    return result.reset_index()
@@ -0,0 +1,91 @@
+import re
+from lxml import etree, html
+
+# SUUMO一覧ページ（静的HTML）を1パスで解析する
+
+# classを含む要素のXPath条件
+def _cls(name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+# セレクタは読み込み時に一度だけコンパイル
+last_page_xpath = etree.XPath(
+    f"//*[@id='js-leftColumnForm']/div[{_cls('error_pop')} and {_cls('error_pop--fr')}]/div"
+)
+listing_xpath = etree.XPath("//*[@id='js-bukkenList']")
+properties_xpath = etree.XPath("//*[@id='js-bukkenList']/ul/li")
+building_type_xpath = etree.XPath(f".//*[{_cls('cassetteitem_content-label')}]/span")
+building_name_xpath = etree.XPath(f".//*[{_cls('cassetteitem_content-title')}]")
+line_info_xpath = etree.XPath(f".//*[{_cls('cassetteitem_detail-col2')}]/*[1][self::div]")
+rows_xpath = etree.XPath(f".//*[{_cls('cassetteitem-item')}]/table/tbody/tr | .//*[{_cls('cassetteitem-item')}]/table/tr")
+rent_xpath = etree.XPath("./*[4][self::td]/ul/li[1]/span/span")
+management_fee_xpath = etree.XPath("./*[4][self::td]/ul/li[2]/span")
+
+# 一覧も最終ページの表示もないページ（アクセス制限・エラーページ）
+class BlockedPageError(Exception):
+    pass
+
+# 要素の表示テキスト（空白を詰める）
+def _text(elements):
+    if not elements:
+        raise ValueError("element not found")
+    return " ".join(elements[0].text_content().split())
+
+# 路線情報から駅名を取得
+def station_from_line_info(line_info):
+    match = re.search(r"/(.+?)駅", line_info)
+    return match.group(1) if match else None
+
+# 賃料・管理費のテキストを「万円」単位の数値に変換し、月額を計算
+def parse_price(rent_text, management_fee_text):
+    # 賃料を「万円」単位に変換
+    rent = float(rent_text.replace("万円", "").strip())
+
+    # 管理費を「万円」単位に変換
+    if management_fee_text == "-":
+        management_fee = 0  # 管理費が`-`の場合は0
+    else:
+        management_fee = float(management_fee_text.replace("円", "").replace(",", "").strip()) / 10000  # 円を万円に変換
+
+    # 月額を計算
+    return rent, management_fee, rent + management_fee
+
+# 1物件分の行データ
+def make_record(building_type, building_name, line_info, rent, management_fee, monthly_cost):
+    return {
+        "建物種別": building_type,
+        "建物名": building_name,
+        "路線情報": line_info,
+        "駅名": station_from_line_info(line_info),
+        "賃料": rent,
+        "管理費": management_fee,
+        "月額": monthly_cost,
+    }
+
+# 一覧ページのHTMLを解析（最終ページを超えた場合はNone、一覧のないページはBlockedPageError）
+def parse_listing_html(page_html):
+    tree = html.fromstring(page_html)
+
+    # 最大ページ判定
+    if last_page_xpath(tree):
+        return None
+    if not listing_xpath(tree):
+        raise BlockedPageError("no listing on page (blocked or error page)")
+
+    page_data = []
+    for property in properties_xpath(tree):
+        building_type = _text(building_type_xpath(property))
+        building_name = _text(building_name_xpath(property))
+        line_info = _text(line_info_xpath(property))
+
+        for row in rows_xpath(property):
+            try:
+                rent, management_fee, monthly_cost = parse_price(
+                    _text(rent_xpath(row)), _text(management_fee_xpath(row))
+                )
+            except Exception as e:
+                print(f"Error processing rent or management fee: {e}")
+                rent, management_fee, monthly_cost = None, None, None
+
+            page_data.append(make_record(building_type, building_name, line_info, rent, management_fee, monthly_cost))
+
+    return page_data